@@ -0,0 +1,76 @@
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+API_PREFIX = '/api/v1'
+
+# Fields a client may ask for with ?fields=a,b,c; anything else is not part of the API
+API_PRODUCT_FIELDS = ('id', 'sku', 'name', 'description', 'price', 'stock_quantity', 'category', 'reorder_level',
+                      'rating_count', 'average_rating')
+API_REVIEW_FIELDS = ('rating', 'review', 'created_at', 'username')
+API_CART_FIELDS = ('id', 'name', 'price', 'stock_quantity', 'category', 'quantity', 'line_total')
+API_ORDER_FIELDS = ('id', 'customer_id', 'order_date', 'status', 'total_amount', 'items')
+
+
+# The requested subset of allowed (all of it when ?fields is absent).
+# Raises ValueError naming any field that is not allowed.
+def parse_fields(value, allowed):
+    if not value:
+        return list(allowed)
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in allowed]
+    if unknown or not fields:
+        raise ValueError(f"Unknown fields: {', '.join(unknown) or value}. Available: {', '.join(allowed)}")
+    return fields
+
+
+def select_fields(row, fields):
+    return {field: row.get(field) for field in fields}
+
+
+# Strong ETag for a catalog resource: it changes with the catalog version and
+# the exact request, and can be computed before any query runs
+def catalog_etag(version, path, args):
+    key = json.dumps([version, path, sorted(args.items(multi=True))], default=str)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+# Compressed bodies carry the ETag with an encoding suffix, which a client
+# then sends back in If-None-Match; either form counts as a match
+ENCODING_SUFFIXES = {'gzip': '-gz', 'br': '-br'}
+
+
+def etag_matches(if_none_match, etag):
+    if if_none_match.star_tag:
+        return True
+    return any(tag in if_none_match for tag in [etag] + [etag + suffix for suffix in ENCODING_SUFFIXES.values()])
+
+
+# Compress a finished response with brotli (when installed) or gzip, as the
+# client accepts. Small, streamed and already-encoded bodies are left alone.
+def compress_response(response, accept_encodings, min_size=1024, gzip_level=6, brotli_quality=5):
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+    encoding = accept_encodings.best_match(encodings)
+    body = response.get_data()
+    if encoding is None or len(body) < min_size:
+        return response
+
+    if encoding == 'br':
+        body = brotli.compress(body, quality=brotli_quality)
+    else:
+        body = gzip.compress(body, compresslevel=gzip_level, mtime=0)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(etag + ENCODING_SUFFIXES[encoding], weak=weak)
+    return response
@@ -0,0 +1,151 @@
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import urllib.request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Third-party files the templates used to load from CDNs, by the name the
+# templates ask for: (path under static/, pinned upstream URL). `flask --app
+# app vendor-assets` downloads them; until then the templates keep using the CDN.
+VENDOR_ASSETS = {
+    'bootstrap.css': ('vendor/bootstrap/bootstrap.min.css',
+                      'https://stackpath.bootstrapcdn.com/bootstrap/4.3.1/css/bootstrap.min.css'),
+    'bootstrap.js': ('vendor/bootstrap/bootstrap.min.js',
+                     'https://stackpath.bootstrapcdn.com/bootstrap/4.3.1/js/bootstrap.min.js'),
+    'jquery.js': ('vendor/jquery/jquery-3.3.1.slim.min.js', 'https://code.jquery.com/jquery-3.3.1.slim.min.js'),
+    'popper.js': ('vendor/popper/popper.min.js', 'https://cdnjs.cloudflare.com/ajax/libs/popper.js/1.14.7/umd/popper.min.js'),
+    'fontawesome.css': ('vendor/fontawesome/css/all.min.css',
+                        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/css/all.min.css'),
+    'lottie.js': ('vendor/lottie/lottie.min.js', 'https://cdnjs.cloudflare.com/ajax/libs/bodymovin/5.7.8/lottie.min.js'),
+}
+# The Font Awesome stylesheet loads these relative to itself; woff2/woff cover every current browser
+VENDOR_ASSETS.update({
+    f'{font}.{ext}': (f'vendor/fontawesome/webfonts/{font}.{ext}',
+                      f'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/5.15.4/webfonts/{font}.{ext}')
+    for font in ('fa-brands-400', 'fa-regular-400', 'fa-solid-900') for ext in ('woff2', 'woff')
+})
+# sha256 of every vendored file as first downloaded; later downloads must match
+VENDOR_LOCK = 'vendor/.lock.json'
+
+MANIFEST = 'manifest.json'
+# Text formats worth precompressing; images, woff and woff2 are compressed already
+COMPRESSIBLE = ('.css', '.js', '.json', '.svg', '.txt', '.map', '.ttf', '.eot', '.html')
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'wb') as f:
+        f.write(data)
+    os.replace(temp, path)
+
+
+def _sources(static_folder, output):
+    for root, dirs, files in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and
+                         os.path.relpath(os.path.join(root, d), static_folder) != output)
+        for name in sorted(files):
+            if not name.startswith('.'):
+                path = os.path.join(root, name)
+                yield os.path.relpath(path, static_folder).replace(os.sep, '/'), path
+
+
+# Point url(...) references of a stylesheet at the fingerprinted files
+def _rewrite_css(content, logical_path, manifest, output):
+    base = posixpath.dirname(logical_path)
+
+    def replace(match):
+        url = match.group(2).strip()
+        if re.match(r'^(data:|[a-z]+:|//|/|#)', url):
+            return match.group(0)
+        path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+        target = manifest.get(posixpath.normpath(posixpath.join(base, path)))
+        if target is None:
+            return match.group(0)
+        relative = posixpath.relpath(target[len(output) + 1:], base)
+        return f'url({match.group(1)}{relative}{suffix}{match.group(1)})'
+    return _CSS_URL.sub(replace, content.decode()).encode()
+
+
+# Copy every file under static/ to static/<output>/ with a content hash in
+# its name, minify JSON (floats rounded to json_precision places), point
+# stylesheets at the hashed files and write .gz (and .br, with the brotli
+# package) next to anything compressible. Returns {logical path:
+# fingerprinted path}, which is also written to the manifest.
+def build_assets(static_folder, output='build', json_precision=3, gzip_level=9, brotli_quality=11):
+    manifest = {}
+    # Stylesheets go last so every file they reference already has its hashed name
+    for logical_path, path in sorted(_sources(static_folder, output), key=lambda item: item[0].endswith('.css')):
+        with open(path, 'rb') as f:
+            content = f.read()
+        if logical_path.endswith('.json'):
+            # Lottie animations carry float noise (16.516000000000002) that no frame needs
+            content = json.loads(content, parse_float=lambda value: round(float(value), json_precision))
+            content = json.dumps(content, separators=(',', ':'), ensure_ascii=False).encode()
+        elif logical_path.endswith('.css'):
+            content = _rewrite_css(content, logical_path, manifest, output)
+
+        stem, ext = posixpath.splitext(logical_path)
+        hashed = f'{output}/{stem}.{hashlib.sha256(content).hexdigest()[:12]}{ext}'
+        target = os.path.join(static_folder, *hashed.split('/'))
+        # Same name means same content, so files from an earlier build are kept as they are
+        if not os.path.exists(target):
+            _write_atomic(target, content)
+            if ext in COMPRESSIBLE:
+                variants = {'gzip': gzip.compress(content, compresslevel=gzip_level, mtime=0)}
+                if brotli is not None:
+                    variants['br'] = brotli.compress(content, quality=brotli_quality)
+                for encoding, data in variants.items():
+                    if len(data) < len(content):
+                        _write_atomic(target + ENCODING_SUFFIXES[encoding], data)
+        manifest[logical_path] = hashed
+
+    _write_atomic(os.path.join(static_folder, output, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    return manifest
+
+
+# The manifest of the last build, or None when there is none or a source file changed since
+def load_manifest(static_folder, output='build'):
+    path = os.path.join(static_folder, output, MANIFEST)
+    try:
+        built_at = os.path.getmtime(path)
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    sources = dict(_sources(static_folder, output))
+    if set(sources) != set(manifest) or any(os.path.getmtime(source) > built_at for source in sources.values()):
+        return None
+    return manifest
+
+
+# Download VENDOR_ASSETS into static/. Returns (path, bytes) for each file;
+# raises ValueError if a file no longer matches the hash in the lock file.
+def vendor_assets(static_folder, timeout=30):
+    lock_path = os.path.join(static_folder, VENDOR_LOCK)
+    try:
+        with open(lock_path) as f:
+            lock = json.load(f)
+    except (OSError, ValueError):
+        lock = {}
+
+    downloaded = []
+    for path, url in VENDOR_ASSETS.values():
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            content = response.read()
+        digest = hashlib.sha256(content).hexdigest()
+        if lock.setdefault(path, digest) != digest:
+            raise ValueError(f'{url} does not match the sha256 recorded in {VENDOR_LOCK}')
+        _write_atomic(os.path.join(static_folder, *path.split('/')), content)
+        downloaded.append((path, len(content)))
+    _write_atomic(lock_path, json.dumps(lock, indent=1, sort_keys=True).encode())
+    return downloaded
@@ -0,0 +1,116 @@
+# Compares the old per-product AVG(rating) loop on /products with the single
+# query against the product_ratings summary. Runs on an in-memory SQLite
+# database so it needs no MySQL server.
+#
+#   python benchmarks/catalog_queries.py [--sizes 15 1000 50000] [--reviews-per-product 3]
+
+import argparse
+import random
+import sqlite3
+import time
+
+
+class CountingCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.queries = 0
+
+    def execute(self, sql, params=()):
+        self.queries += 1
+        return self._cursor.execute(sql, params)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+
+def build_database(product_count, reviews_per_product):
+    conn = sqlite3.connect(':memory:')
+    conn.executescript("""
+        CREATE TABLE products (
+            id INTEGER PRIMARY KEY, name TEXT, description TEXT,
+            price REAL, stock_quantity INTEGER, category TEXT
+        );
+        CREATE TABLE reviews (
+            id INTEGER PRIMARY KEY, user_id INTEGER, product_id INTEGER, rating INTEGER, review TEXT
+        );
+        CREATE INDEX reviews_product_id ON reviews (product_id);
+        CREATE TABLE product_ratings (
+            product_id INTEGER PRIMARY KEY, rating_count INTEGER NOT NULL, rating_sum INTEGER NOT NULL
+        );
+    """)
+    rng = random.Random(42)
+    categories = ['Pain Relief', 'Allergy', 'Diabetes Care', 'Antibiotics', 'Supplements', 'Cold and Flu']
+    conn.executemany(
+        "INSERT INTO products (id, name, description, price, stock_quantity, category) VALUES (?, ?, ?, ?, ?, ?)",
+        ((i, f'Product {i}', 'Synthetic product', rng.uniform(1, 50), rng.randint(0, 300), rng.choice(categories))
+         for i in range(1, product_count + 1)))
+    conn.executemany(
+        "INSERT INTO reviews (user_id, product_id, rating, review) VALUES (?, ?, ?, ?)",
+        ((3, rng.randint(1, product_count), rng.randint(1, 5), 'ok')
+         for _ in range(product_count * reviews_per_product)))
+    conn.execute("""
+        INSERT INTO product_ratings (product_id, rating_count, rating_sum)
+        SELECT product_id, COUNT(*), SUM(rating) FROM reviews GROUP BY product_id
+    """)
+    conn.commit()
+    return conn
+
+
+def catalog_per_product(cursor):
+    cursor.execute("SELECT * FROM products")
+    products = [list(row) for row in cursor.fetchall()]
+    cursor.execute("SELECT DISTINCT category FROM products")
+    cursor.fetchall()
+    for product in products:
+        cursor.execute("SELECT AVG(rating) FROM reviews WHERE product_id = ?", (product[0],))
+        product.append(cursor.fetchone()[0])
+    return products
+
+
+def catalog_summary(cursor):
+    cursor.execute("""
+        SELECT p.*, pr.rating_count, CAST(pr.rating_sum AS REAL) / pr.rating_count AS average_rating
+        FROM products p
+        LEFT JOIN product_ratings pr ON pr.product_id = p.id
+    """)
+    products = cursor.fetchall()
+    cursor.execute("SELECT DISTINCT category FROM products")
+    cursor.fetchall()
+    return products
+
+
+def measure(conn, fn, repeat):
+    best = None
+    queries = 0
+    for _ in range(repeat):
+        cursor = CountingCursor(conn.cursor())
+        started = time.perf_counter()
+        fn(cursor)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+        queries = cursor.queries
+    return queries, best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /products catalog queries')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[15, 1000, 50000])
+    parser.add_argument('--reviews-per-product', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'products':>9} | {'strategy':<12} | {'queries':>8} | {'best ms':>9}")
+    print('-' * 48)
+    for size in args.sizes:
+        conn = build_database(size, args.reviews_per_product)
+        for name, fn in (('per-product', catalog_per_product), ('summary', catalog_summary)):
+            queries, ms = measure(conn, fn, args.repeat)
+            print(f"{size:>9} | {name:<12} | {queries:>8} | {ms:>9.2f}")
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# Fires many parallel checkouts at one product with limited stock and checks
+# that placing orders never oversells. Uses the database configured in app.py
+# (or a throwaway SQLite file in WAL mode with --backend sqlite) and cleans up
+# the product and orders it created. Exits non-zero if any checkout oversold
+# or failed with a database error. tests/test_checkout_concurrency.py makes the
+# same check on SQLite as part of the test suite.
+#
+#   python benchmarks/checkout_stress.py [--threads 32] [--checkouts 500] [--stock 100] [--quantity 1]
+#                                        [--backend mysql|sqlite]
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as pharmacy
+from backends import DatabaseError
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent checkout stress test')
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--checkouts', type=int, default=500)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--quantity', type=int, default=1, help='units of the product per checkout')
+    parser.add_argument('--customer-id', type=int, default=3)
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default=pharmacy.app.config['DB_BACKEND'])
+    args = parser.parse_args()
+
+    pharmacy.app.config['DB_BACKEND'] = args.backend
+    if args.backend == 'sqlite':
+        # A file rather than ':memory:', whose shared cache fails lock waits instead of queueing them
+        pharmacy.app.config['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'checkout_stress.sqlite3')
+
+    pharmacy.app.config['DB_POOL_SIZE'] = args.threads
+    pharmacy.app.config['DB_POOL_MAX_OVERFLOW'] = 0
+
+    conn = pharmacy.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO products (name, description, price, stock_quantity, category) VALUES (%s, %s, %s, %s, %s)",
+                   ('Stress Test Item', 'Created by checkout_stress.py', 1.00, args.stock, 'Benchmark'))
+    product_id = cursor.lastrowid
+    conn.commit()
+
+    results = {'placed': 0, 'rejected': 0, 'errors': 0}
+    order_ids = []
+    remaining = [args.checkouts]
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            try:
+                order_id = pharmacy.db.orders.place(args.customer_id, {product_id: args.quantity})
+                outcome = 'placed'
+            except pharmacy.InsufficientStock:
+                order_id, outcome = None, 'rejected'
+            except DatabaseError as err:
+                print(err)
+                order_id, outcome = None, 'errors'
+            with lock:
+                results[outcome] += 1
+                if order_id:
+                    order_ids.append(order_id)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    cursor.execute("SELECT stock_quantity FROM products WHERE id = %s", (product_id,))
+    final_stock = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM OrderItems WHERE product_id = %s", (product_id,))
+    units_sold = int(cursor.fetchone()[0])
+
+    if order_ids:
+        placeholders = ", ".join(["%s"] * len(order_ids))
+        cursor.execute(f"DELETE FROM order_events WHERE order_id IN ({placeholders})", order_ids)
+        cursor.execute(f"DELETE FROM OrderItems WHERE order_id IN ({placeholders})", order_ids)
+        cursor.execute(f"DELETE FROM Orders WHERE id IN ({placeholders})", order_ids)
+    cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    print(f"threads={args.threads} checkouts={args.checkouts} stock={args.stock} quantity={args.quantity}")
+    print(f"placed={results['placed']} rejected={results['rejected']} errors={results['errors']}")
+    print(f"final stock={final_stock} units sold={units_sold}")
+    print(f"{args.checkouts / elapsed:.1f} checkouts/sec, {results['placed'] / elapsed:.1f} orders/sec")
+    print(pharmacy.get_db_pool().stats())
+
+    oversold = final_stock < 0 or final_stock + units_sold != args.stock or units_sold != results['placed'] * args.quantity
+    if oversold:
+        print('FAIL: stock and order items disagree')
+        sys.exit(1)
+    if results['errors']:
+        print(f"FAIL: {results['errors']} checkouts failed with a database error")
+        sys.exit(1)
+    print('OK: no oversell and no errors')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+# Requests /export/orders.csv as an admin through the app's test client at
+# growing numbers of order items and checks that peak RSS stays flat while
+# the streamed body is read to the end. The database is seeded up to each
+# size in this process; each export then runs in a fresh process, so
+# ru_maxrss covers only the app, the login and the export. Uses the database
+# configured in app.py (or a throwaway SQLite file with --backend sqlite) and
+# removes the customer, product and orders it created. Exits non-zero if the
+# largest export peaks noticeably above the smallest. tests/test_export_memory.py
+# makes the same check on SQLite as part of the test suite.
+#
+#   python benchmarks/export_memory.py [--rows 10000 100000 1000000] [--format csv] [--tolerance-mb 16]
+#                                      [--backend mysql|sqlite]
+
+import argparse
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as pharmacy
+
+ADMIN = ('Admin', 'testingAdminPass1234')
+ITEMS_PER_ORDER = 3
+SEED_BATCH_SIZE = 5000  # orders per INSERT round
+
+
+def configure(backend, sqlite_path):
+    pharmacy.app.config.update(DB_BACKEND=backend, SESSION_BACKEND='memory', OUTBOX_EMBEDDED_WORKER=False,
+                               STOCK_EMBEDDED_SWEEPER=False)
+    if backend == 'sqlite':
+        pharmacy.app.config['SQLITE_PATH'] = sqlite_path
+
+
+def create_fixtures(cursor):
+    name = f'export-memory-{uuid.uuid4().hex[:12]}'
+    cursor.execute("INSERT INTO users (username, email, password, role) VALUES (%s, %s, %s, %s)",
+                   (name, f'{name}@example.com', '!', 'Customer'))
+    customer_id = cursor.lastrowid
+    cursor.execute("INSERT INTO products (name, description, price, stock_quantity, category) VALUES (%s, %s, %s, %s, %s)",
+                   ('Export Memory Item', 'Created by export_memory.py', 9.99, 0, 'Benchmark'))
+    return customer_id, cursor.lastrowid
+
+
+# Add orders of ITEMS_PER_ORDER items each until the fixture customer has
+# item_count items; returns the item count reached
+def seed(cursor, customer_id, product_id, seeded, item_count):
+    started = datetime(2024, 1, 1)
+    while seeded < item_count:
+        orders = min(SEED_BATCH_SIZE, -(-(item_count - seeded) // ITEMS_PER_ORDER))
+        first = seeded // ITEMS_PER_ORDER
+        cursor.executemany("INSERT INTO Orders (customer_id, order_date, status, total_amount) VALUES (%s, %s, %s, %s)",
+                           [(customer_id, started + timedelta(minutes=first + i), 'Delivered', 29.97)
+                            for i in range(orders)])
+        cursor.execute("SELECT id FROM Orders WHERE customer_id = %s ORDER BY id DESC LIMIT %s", (customer_id, orders))
+        order_ids = [row[0] for row in cursor.fetchall()]
+        cursor.executemany("INSERT INTO OrderItems (order_id, product_id, quantity, price) VALUES (%s, %s, %s, %s)",
+                           [(order_id, product_id, 1, 9.99) for order_id in order_ids for _ in range(ITEMS_PER_ORDER)])
+        seeded += orders * ITEMS_PER_ORDER
+    return seeded
+
+
+def remove_fixtures(cursor, customer_id, product_id):
+    cursor.execute("DELETE FROM OrderItems WHERE order_id IN (SELECT id FROM Orders WHERE customer_id = %s)", (customer_id,))
+    cursor.execute("DELETE FROM Orders WHERE customer_id = %s", (customer_id,))
+    cursor.execute("DELETE FROM users WHERE id = %s", (customer_id,))
+    cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
+
+
+# Child: log in, stream the export to the end and report rows, peak RSS,
+# bytes, seconds and time to the first chunk
+def run_export(fmt):
+    client = pharmacy.app.test_client()
+    response = client.post('/login', data={'username': ADMIN[0], 'password': ADMIN[1]})
+    assert response.status_code == 302, response.status_code
+    started = time.perf_counter()
+    response = client.get(f'/export/orders.{fmt}', buffered=False)
+    assert response.status_code == 200, response.status_code
+    total_bytes = lines = 0
+    first_chunk_at = None
+    for chunk in response.iter_encoded():
+        if first_chunk_at is None:
+            first_chunk_at = time.perf_counter() - started
+        total_bytes += len(chunk)
+        lines += chunk.count(b'\n')
+    response.close()
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_kb //= 1024
+    rows = lines - 1 if fmt == 'csv' else lines
+    print(f"{rows} {peak_kb} {total_bytes} {elapsed:.3f} {(first_chunk_at or 0) * 1000:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that streaming exports run in bounded memory')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    parser.add_argument('--tolerance-mb', type=float, default=16)
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default=pharmacy.app.config['DB_BACKEND'])
+    parser.add_argument('--sqlite-path', help=argparse.SUPPRESS)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        configure(args.backend, args.sqlite_path)
+        run_export(args.format)
+        return
+
+    # A file rather than ':memory:', so the export processes see the seeded rows
+    workdir = tempfile.mkdtemp() if args.backend == 'sqlite' else None
+    sqlite_path = os.path.join(workdir, 'export_memory.sqlite3') if workdir else None
+    configure(args.backend, sqlite_path)
+    conn = pharmacy.get_db_connection()
+    cursor = conn.cursor()
+    customer_id, product_id = create_fixtures(cursor)
+    conn.commit()
+
+    print(f"backend={args.backend} format={args.format}")
+    print(f"{'items':>9} | {'exported':>9} | {'peak RSS MB':>11} | {'output MB':>9} | {'seconds':>8} | {'first chunk ms':>14}")
+    print('-' * 79)
+    peaks, seeded = [], 0
+    try:
+        for row_count in sorted(args.rows):
+            seeded = seed(cursor, customer_id, product_id, seeded, row_count)
+            conn.commit()
+            command = [sys.executable, __file__, '--child', '--format', args.format, '--backend', args.backend]
+            if sqlite_path:
+                command += ['--sqlite-path', sqlite_path]
+            output = subprocess.run(command, check=True, capture_output=True, text=True).stdout.split()
+            rows, peak_kb, total_bytes, seconds, first_ms = output[-5:]
+            if int(rows) < seeded:
+                print(f"FAIL: exported {rows} rows, expected at least {seeded}")
+                sys.exit(1)
+            peaks.append(int(peak_kb) / 1024)
+            print(f"{seeded:>9} | {int(rows):>9} | {peaks[-1]:>11.1f} | {int(total_bytes) / 1048576:>9.1f} | "
+                  f"{float(seconds):>8.2f} | {float(first_ms):>14.2f}")
+    finally:
+        remove_fixtures(cursor, customer_id, product_id)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    growth = max(peaks) - peaks[0]
+    if growth > args.tolerance_mb:
+        print(f"FAIL: peak RSS grew by {growth:.1f} MB")
+        sys.exit(1)
+    print(f"OK: peak RSS grew by {growth:.1f} MB across sizes")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+# Checkout throughput on one hot product as concurrency grows, with its stock
+# on the products row and then split over --shards stock shards. Unsplit,
+# every checkout waits for the row lock the one before it holds until it
+# commits, so orders/sec flattens out however many threads there are; split,
+# concurrent checkouts mostly lock different rows. Each thread is its own
+# customer. With --hold every checkout first holds the unit the way adding to
+# the cart does. Uses the database configured in app.py (or a throwaway
+# SQLite file with --backend sqlite, which takes one writer at a time
+# whatever the layout, so only MySQL shows the difference) and removes the
+# product, customers and orders it created.
+#
+#   python benchmarks/hot_sku.py [--threads 1,4,16,64] [--shards 16] [--seconds 5] [--hold]
+#                                [--backend mysql|sqlite]
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as pharmacy
+from backends import DatabaseError
+
+STOCK = 10 ** 7
+
+
+def create_fixtures(cursor, customers):
+    cursor.execute("INSERT INTO products (name, description, price, stock_quantity, category) VALUES (%s, %s, %s, %s, %s)",
+                   ('Hot SKU Item', 'Created by hot_sku.py', 1.00, STOCK, 'Benchmark'))
+    product_id = cursor.lastrowid
+    customer_ids = []
+    for _ in range(customers):
+        name = f'hot-sku-{uuid.uuid4().hex[:12]}'
+        cursor.execute("INSERT INTO users (username, email, password, role) VALUES (%s, %s, %s, %s)",
+                       (name, f'{name}@example.com', '!', 'Customer'))
+        customer_ids.append(cursor.lastrowid)
+    return product_id, customer_ids
+
+
+def remove_fixtures(cursor, product_id, customer_ids):
+    placeholders = ", ".join(["%s"] * len(customer_ids))
+    cursor.execute(f"SELECT id FROM Orders WHERE customer_id IN ({placeholders})", customer_ids)
+    order_ids = [row[0] for row in cursor.fetchall()]
+    if order_ids:
+        order_placeholders = ", ".join(["%s"] * len(order_ids))
+        cursor.execute(f"DELETE FROM order_events WHERE order_id IN ({order_placeholders})", order_ids)
+        cursor.execute(f"DELETE FROM OrderItems WHERE order_id IN ({order_placeholders})", order_ids)
+        cursor.execute(f"DELETE FROM Orders WHERE id IN ({order_placeholders})", order_ids)
+    cursor.execute(f"DELETE FROM stock_reservations WHERE user_id IN ({placeholders})", customer_ids)
+    cursor.execute(f"DELETE FROM users WHERE id IN ({placeholders})", customer_ids)
+    cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
+
+
+# Checkouts of one unit each from every customer thread for the given time
+def run(product_id, customer_ids, seconds, hold):
+    latencies, failures = [], Counter()
+    deadline = time.perf_counter() + seconds
+
+    def worker(customer_id):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                if hold:
+                    pharmacy.db.stock.hold(customer_id, product_id, 1, 900)
+                pharmacy.db.orders.place(customer_id, {product_id: 1})
+            except pharmacy.InsufficientStock:
+                failures['short'] += 1
+                continue
+            except DatabaseError as err:
+                failures[str(err)] += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=worker, args=(customer_id,)) for customer_id in customer_ids]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'orders_per_sec': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+        'failures': dict(failures),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Contention benchmark for checkouts of a single hot product')
+    parser.add_argument('--threads', default='1,4,16,64', help='comma-separated concurrency levels')
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of each run')
+    parser.add_argument('--hold', action='store_true', help='hold the unit (add to cart) before each checkout')
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default=pharmacy.app.config['DB_BACKEND'])
+    args = parser.parse_args()
+    levels = [int(level) for level in args.threads.split(',')]
+
+    pharmacy.app.config['DB_BACKEND'] = args.backend
+    if args.backend == 'sqlite':
+        # A file rather than ':memory:', whose shared cache fails lock waits instead of queueing them
+        pharmacy.app.config['SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(), 'hot_sku.sqlite3')
+    pharmacy.app.config['DB_POOL_SIZE'] = max(levels) + 1
+    pharmacy.app.config['DB_POOL_MAX_OVERFLOW'] = 0
+
+    conn = pharmacy.get_db_connection()
+    cursor = conn.cursor()
+    product_id, customer_ids = create_fixtures(cursor, max(levels))
+    conn.commit()
+
+    try:
+        print(f"backend={args.backend} shards={args.shards} seconds={args.seconds} hold={args.hold}")
+        print(f"{'threads':>7} | {'layout':<9} | {'orders/s':>9} | {'p50 ms':>7} | {'p99 ms':>7} | failures")
+        print('-' * 64)
+        for level in levels:
+            results = {}
+            for shards in (0, args.shards):
+                pharmacy.db.stock.split(product_id, shards)
+                results[shards] = result = run(product_id, customer_ids[:level], args.seconds, args.hold)
+                layout = f'{shards} shards' if shards else 'unsplit'
+                print(f"{level:>7} | {layout:<9} | {result['orders_per_sec']:>9.1f} | {result['p50_ms']:>7.2f} | "
+                      f"{result['p99_ms']:>7.2f} | {result['failures'] or '-'}")
+            if results[0]['orders_per_sec']:
+                print(f"{'':>7}   speedup {results[args.shards]['orders_per_sec'] / results[0]['orders_per_sec']:.2f}x")
+
+        # Every unit is still in stock, held (a hold whose checkout failed) or on an order item
+        pharmacy.db.stock.split(product_id, 0)
+        conn.commit()
+        cursor.execute("SELECT stock_quantity, units_sold FROM products WHERE id = %s", (product_id,))
+        stock, units_sold = cursor.fetchone()
+        cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM stock_reservations WHERE product_id = %s", (product_id,))
+        held = int(cursor.fetchone()[0])
+        cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM OrderItems WHERE product_id = %s", (product_id,))
+        ordered = int(cursor.fetchone()[0])
+    finally:
+        remove_fixtures(cursor, product_id, customer_ids)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+    print(f"stock={stock} held={held} units_sold={units_sold} ordered={ordered}")
+    if stock + held + ordered != STOCK or units_sold != ordered:
+        print('FAIL: stock, sales counters and order items disagree')
+        sys.exit(1)
+    print('OK: every unit accounted for')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+# Load test for the main user journeys. Seeds a throwaway database from
+# database.sql plus synthetic users, products, orders and reviews, then has
+# concurrent customers browse -> add_to_cart -> view_cart -> confirm_order ->
+# view_order_history while admins load the report pages. Requests go through
+# the Flask test client in this process, so the per-route query counts come
+# straight from the app's instrumentation. Results are written as JSON and
+# can be compared against an earlier run with --baseline. --backend sqlite
+# runs the same test against an embedded database file, no server needed.
+#
+#   python benchmarks/load_test.py [--backend mysql|sqlite] [--database pharmacy_bench] [--sqlite-path bench.sqlite3]
+#                                  [--users 200 --products 2000 --orders 20000 --reviews 5000]
+#                                  [--clients 16] [--journeys 400] [--admin-clients 2] [--admin-requests 60]
+#                                  [--output results.json] [--baseline baseline.json] [--max-regression 20]
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import app as pharmacy
+from instrumentation import Metrics
+
+CATEGORIES = ['Pain Relief', 'Allergy', 'Cold & Flu', 'Digestive Health', 'Vitamins',
+              'Skin Care', 'First Aid', 'Antibiotics', 'Eye Care', 'Baby Care']
+WORDS = ['relief', 'tablet', 'capsule', 'syrup', 'cream', 'extra', 'strength', 'daily', 'night',
+         'junior', 'forte', 'rapid', 'gentle', 'plus', 'max', 'care', 'complex', 'gel', 'drops', 'spray']
+PASSWORD = 'benchmarkPass1234'
+BATCH = 1000
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def batched(rows, size=BATCH):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+# Start from an empty database built from database.sql
+def reset_database(args):
+    if args.backend == 'sqlite':
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.sqlite_path + suffix):
+                os.remove(args.sqlite_path + suffix)
+        # The SQLite backend creates the schema when it opens a new file
+        return pharmacy.get_db_backend()
+    import mysql.connector
+    server = mysql.connector.connect(**{k: v for k, v in pharmacy.db_config.items() if k != 'database'})
+    server.cursor().execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+    server.close()
+    backend = pharmacy.get_db_backend()
+    backend.create_schema()
+    return backend
+
+
+def seed(args, rng):
+    server = reset_database(args).connect()
+    cursor = server.cursor()
+
+    # Every synthetic account shares one hash so seeding does not spend minutes in scrypt
+    password_hash = pharmacy.get_password_hasher().hash(PASSWORD)
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM users")
+    first_user_id = cursor.fetchone()[0] + 1
+    users = [(f'bench_customer_{i}', f'bench_customer_{i}@example.com', password_hash, 'Customer',
+              'Bench', f'Customer {i}', '1990-01-01', rng.choice(['Male', 'Female']), '0500000000')
+             for i in range(args.users)]
+    users.append(('bench_admin', 'bench_admin@example.com', password_hash, 'Admin',
+                  'Bench', 'Admin', '1990-01-01', 'Other', '0500000000'))
+    for rows in batched(users):
+        cursor.executemany("""
+            INSERT INTO users (username, email, password, role, first_name, last_name, date_of_birth, gender, phone_number)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, rows)
+    customer_ids = list(range(first_user_id, first_user_id + args.users))
+
+    products = []
+    for i in range(args.products):
+        name = ' '.join(rng.sample(WORDS, 2)).title() + f' {i}'
+        products.append((name, f'{name} - synthetic product', round(rng.uniform(1, 120), 2),
+                         # Enough stock that the run itself never sells out
+                         10 ** 6, rng.choice(CATEGORIES), rng.choice([None, 5, 10, 25])))
+    for rows in batched(products):
+        cursor.executemany("""
+            INSERT INTO products (name, description, price, stock_quantity, category, reorder_level)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, rows)
+    cursor.execute("SELECT id, price FROM products")
+    prices = dict(cursor.fetchall())
+    product_ids = list(prices)
+
+    now = datetime.now().replace(microsecond=0)
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Orders")
+    next_order_id = cursor.fetchone()[0] + 1
+    orders, items = [], []
+    for order_id in range(next_order_id, next_order_id + args.orders):
+        lines = {product_id: rng.randint(1, 3) for product_id in rng.sample(product_ids, rng.randint(1, 4))}
+        total = sum(prices[product_id] * quantity for product_id, quantity in lines.items())
+        order_date = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+        status = rng.choices(pharmacy.ORDER_STATUSES, weights=[1, 1, 2, 10, 1])[0]
+        orders.append((order_id, rng.choice(customer_ids), order_date, status, total))
+        items.extend((order_id, product_id, quantity, prices[product_id]) for product_id, quantity in lines.items())
+    for rows in batched(orders):
+        cursor.executemany("INSERT INTO Orders (id, customer_id, order_date, status, total_amount) VALUES (%s, %s, %s, %s, %s)", rows)
+    for rows in batched(items):
+        cursor.executemany("INSERT INTO OrderItems (order_id, product_id, quantity, price) VALUES (%s, %s, %s, %s)", rows)
+
+    # One review per customer and product, as the reviews table enforces
+    reviews = {}
+    for _ in range(args.reviews):
+        key = (rng.choice(customer_ids), rng.choice(product_ids))
+        reviews[key] = key + (rng.choices([1, 2, 3, 4, 5], weights=[1, 1, 2, 4, 5])[0],
+                              'Synthetic review ' + ' '.join(rng.choices(WORDS, k=8)))
+    for rows in batched(list(reviews.values())):
+        cursor.executemany("INSERT INTO reviews (user_id, product_id, rating, review) VALUES (%s, %s, %s, %s)", rows)
+    server.commit()
+    cursor.close()
+    server.close()
+
+    # Derived tables are rebuilt with the app's own maintenance commands
+    runner = pharmacy.app.test_cli_runner()
+    for command in (['rebuild-ratings'], ['rebuild-sales-rollups'], ['reconcile-inventory', '--fix']):
+        result = runner.invoke(args=command)
+        if result.exit_code != 0:
+            raise SystemExit(f"{' '.join(command)} failed: {result.output}")
+    return customer_ids, product_ids
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def request(self, client, name, method, url, expect=(200, 302), **kwargs):
+        started = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            if response.status_code not in expect:
+                self.errors[name] += 1
+        return response
+
+
+def login(client, username):
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    if response.status_code != 302:
+        raise SystemExit(f'Could not log in as {username}')
+
+
+def customer_journey(client, recorder, rng, product_ids):
+    term = rng.choice(WORDS)
+    recorder.request(client, 'view_products', 'GET', '/products', query_string={'q': term})
+    recorder.request(client, 'view_products', 'GET', '/products',
+                     query_string={'category': rng.choice(CATEGORIES), 'sort': 'price_asc'})
+    for product_id in rng.sample(product_ids, rng.randint(1, 3)):
+        recorder.request(client, 'add_to_cart', 'POST', f'/add_to_cart/{product_id}', data={'quantity': rng.randint(1, 2)})
+    recorder.request(client, 'view_cart', 'GET', '/view_cart')
+    recorder.request(client, 'confirm_order', 'POST', '/confirm_order')
+    recorder.request(client, 'view_order_history', 'GET', '/view_order_history')
+
+
+def admin_round(client, recorder, rng):
+    today = datetime.now().date()
+    recorder.request(client, 'sales_report', 'GET', '/sales_report', query_string={
+        'date_from': str(today - timedelta(days=rng.choice([7, 30, 365]))),
+        'date_to': str(today),
+        'granularity': rng.choice(['day', 'week', 'month']),
+    })
+    recorder.request(client, 'inventory_report', 'GET', '/inventory_report', query_string=rng.choice([{}, {'low_stock': '1'}]))
+    recorder.request(client, 'manage_orders', 'GET', '/manage_orders', query_string=rng.choice([{}, {'status': 'Pending'}]))
+
+
+def run_load(args, customer_ids, product_ids):
+    recorder = Recorder()
+    remaining = {'journeys': args.journeys, 'admin': args.admin_requests}
+    lock = threading.Lock()
+
+    def take(kind):
+        with lock:
+            if remaining[kind] == 0:
+                return False
+            remaining[kind] -= 1
+            return True
+
+    def customer(index, client):
+        rng = random.Random(args.seed * 1000 + index)
+        while take('journeys'):
+            customer_journey(client, recorder, rng, product_ids)
+
+    def admin(index, client):
+        rng = random.Random(args.seed * 1000 - index)
+        while take('admin'):
+            admin_round(client, recorder, rng)
+
+    threads = []
+    for i in range(args.clients):
+        client = pharmacy.app.test_client()
+        login(client, f'bench_customer_{i % len(customer_ids)}')
+        threads.append(threading.Thread(target=customer, args=(i, client)))
+    for i in range(args.admin_clients):
+        client = pharmacy.app.test_client()
+        login(client, 'bench_admin')
+        threads.append(threading.Thread(target=admin, args=(i, client)))
+    # Logins are not part of the measurement, so start counting once everyone is in
+    pharmacy.metrics = Metrics()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder, time.perf_counter() - started
+
+
+def summarise(recorder, elapsed):
+    requests = defaultdict(int)
+    for labels, value in pharmacy.metrics.totals('pharmacy_requests_total').items():
+        requests[dict(labels)['endpoint']] += value
+    queries = {dict(labels)['endpoint']: value for labels, value in pharmacy.metrics.totals('pharmacy_db_queries_total').items()}
+    db_time = {dict(labels)['endpoint']: value for labels, value in pharmacy.metrics.totals('pharmacy_db_seconds_total').items()}
+
+    routes = {}
+    for name, latencies in sorted(recorder.latencies.items()):
+        served = requests.get(name) or 1
+        routes[name] = {
+            'requests': len(latencies),
+            'errors': recorder.errors[name],
+            'throughput_rps': round(len(latencies) / elapsed, 2),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'queries_per_request': round(queries.get(name, 0) / served, 2),
+            'db_ms_per_request': round(db_time.get(name, 0) * 1000 / served, 2),
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return routes, {'requests': total, 'seconds': round(elapsed, 2), 'throughput_rps': round(total / elapsed, 2)}
+
+
+def print_table(routes, baseline):
+    print(f"{'route':<20} | {'req':>6} | {'err':>4} | {'rps':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8} | "
+          f"{'q/req':>6} | {'Δp95':>7}")
+    print('-' * 100)
+    for name, route in routes.items():
+        delta = ''
+        if name in baseline and baseline[name]['p95_ms']:
+            delta = f"{(route['p95_ms'] / baseline[name]['p95_ms'] - 1) * 100:+.0f}%"
+        print(f"{name:<20} | {route['requests']:>6} | {route['errors']:>4} | {route['throughput_rps']:>7.1f} | "
+              f"{route['p50_ms']:>8.1f} | {route['p95_ms']:>8.1f} | {route['p99_ms']:>8.1f} | "
+              f"{route['queries_per_request']:>6.1f} | {delta:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a benchmark database and load-test the main user journeys')
+    parser.add_argument('--backend', choices=['mysql', 'sqlite'], default=pharmacy.app.config['DB_BACKEND'])
+    parser.add_argument('--sqlite-path', default='load_test.sqlite3', help='database file for --backend sqlite')
+    parser.add_argument('--host', default=pharmacy.db_config['host'])
+    parser.add_argument('--user', default=pharmacy.db_config['user'])
+    parser.add_argument('--password', default=pharmacy.db_config['password'])
+    parser.add_argument('--database', default='pharmacy_bench', help='dropped and recreated unless --skip-seed')
+    parser.add_argument('--skip-seed', action='store_true', help='reuse a database seeded by an earlier run')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--orders', type=int, default=20000)
+    parser.add_argument('--reviews', type=int, default=5000)
+    parser.add_argument('--clients', type=int, default=16, help='concurrent customers')
+    parser.add_argument('--journeys', type=int, default=400, help='customer journeys in total')
+    parser.add_argument('--admin-clients', type=int, default=2)
+    parser.add_argument('--admin-requests', type=int, default=60, help='rounds of the three admin report pages')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='load_test_results.json')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    parser.add_argument('--max-regression', type=float,
+                        help='exit non-zero if any route p95 is this many percent slower than the baseline')
+    args = parser.parse_args()
+
+    pharmacy.db_config.update(host=args.host, user=args.user, password=args.password, database=args.database)
+    pharmacy.app.config.update(
+        DB_BACKEND=args.backend,
+        SQLITE_PATH=os.path.abspath(args.sqlite_path),
+        DB_POOL_SIZE=args.clients + args.admin_clients,
+        SESSION_BACKEND='memory',
+        SLOW_REQUEST_MS=10 ** 9,
+        SLOW_QUERY_MS=None,
+    )
+
+    rng = random.Random(args.seed)
+    if args.skip_seed:
+        conn = pharmacy.get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id FROM users WHERE username LIKE %s ORDER BY id", ('bench_customer_%',))
+        customer_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT id FROM products ORDER BY id")
+        product_ids = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        conn.close()
+    else:
+        started = time.perf_counter()
+        customer_ids, product_ids = seed(args, rng)
+        print(f"Seeded {args.users} users, {args.products} products, {args.orders} orders, "
+              f"{args.reviews} reviews in {time.perf_counter() - started:.1f}s")
+
+    recorder, elapsed = run_load(args, customer_ids, product_ids)
+    routes, totals = summarise(recorder, elapsed)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['routes']
+    print_table(routes, baseline)
+    print(f"{totals['requests']} requests in {totals['seconds']}s, {totals['throughput_rps']} req/s")
+    print(pharmacy.get_db_pool().stats())
+
+    config = {key: value for key, value in vars(args).items() if key not in ('password', 'output', 'baseline')}
+    with open(args.output, 'w') as f:
+        json.dump({'started': datetime.now().isoformat(timespec='seconds'), 'config': config,
+                   'totals': totals, 'routes': routes}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.max_regression is not None and baseline:
+        regressed = [name for name, route in routes.items()
+                     if name in baseline and baseline[name]['p95_ms']
+                     and route['p95_ms'] > baseline[name]['p95_ms'] * (1 + args.max_regression / 100)]
+        if regressed:
+            print(f"FAIL: p95 regressed more than {args.max_regression:.0f}% on {', '.join(regressed)}")
+            sys.exit(1)
+    if any(route['errors'] for route in routes.values()):
+        print('FAIL: some requests returned unexpected status codes')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# Measures login throughput and latency for several scrypt cost settings, so
+# PASSWORD_SCRYPT_N / PASSWORD_HASH_WORKERS can be tuned to the login SLO.
+# Only the password verification is timed; the user lookup is a single
+# unique-index query and does not change with the cost setting. Logins that
+# find the hashing queue full (PASSWORD_HASH_QUEUE) are refused at once and
+# counted separately.
+#
+#   python benchmarks/login_benchmark.py [--costs 12 13 14 15] [--clients 16] [--logins 200] [--workers 4]
+#                                        [--queue 16]
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from passwords import PasswordHasher, PasswordHasherBusy
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run(log2_n, r, p, workers, queue, clients, logins):
+    hasher = PasswordHasher(n=2 ** log2_n, r=r, p=p, workers=workers, max_queue=queue)
+    stored = hasher.hash('testinCustomerPass1234')
+    latencies = []
+    refused = [0]
+    lock = threading.Lock()
+    remaining = [logins]
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] == 0:
+                    return
+                remaining[0] -= 1
+            started = time.perf_counter()
+            try:
+                assert hasher.verify('testinCustomerPass1234', stored)
+            except PasswordHasherBusy:
+                with lock:
+                    refused[0] += 1
+                continue
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+
+    single = min(latencies) * 1000
+    print(f"{'2^%d' % log2_n:>6} | {128 * 2 ** log2_n * r / 1048576:>7.0f} | {len(latencies) / elapsed:>10.1f} | "
+          f"{single:>9.1f} | {statistics.median(latencies) * 1000:>8.1f} | {percentile(latencies, 0.99) * 1000:>8.1f} | "
+          f"{refused[0]:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark password verification cost settings')
+    parser.add_argument('--costs', type=int, nargs='+', default=[12, 13, 14, 15], help='log2 of the scrypt n parameter')
+    parser.add_argument('-r', type=int, default=8)
+    parser.add_argument('-p', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--queue', type=int, default=16, help='hash jobs that may wait for a worker')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent login requests')
+    parser.add_argument('--logins', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"r={args.r} p={args.p} workers={args.workers} queue={args.queue} clients={args.clients} logins={args.logins}")
+    print(f"{'n':>6} | {'mem MB':>7} | {'logins/s':>10} | {'single ms':>9} | {'p50 ms':>8} | {'p99 ms':>8} | {'refused':>7}")
+    print('-' * 74)
+    for log2_n in args.costs:
+        run(log2_n, args.r, args.p, args.workers, args.queue, args.clients, args.logins)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+# Times every page the render cache covers with the cache off and on, per
+# role. Runs the app on a throwaway SQLite database with some products and
+# orders, so the product rows and order cards have something to render. The
+# catalog cache is on in both runs; the difference is rendering.
+#
+#   python benchmarks/render_cache.py [--products 100] [--orders 20] [--requests 200]
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as pharmacy
+
+ACCOUNTS = {
+    'Admin': ('Admin', 'testingAdminPass1234'),
+    'Pharmacist': ('Pharmacist', 'testingpharmacistPass1234'),
+    'Customer': ('Customer', 'testinCustomerPass1234'),
+}
+STATIC_PAGES = ['/about_us', '/contact_us', '/terms_and_conditions', '/privacy_policy']
+PAGES = {
+    'Admin': ['/admin', '/products?limit=100', '/manage_orders'],
+    'Pharmacist': ['/pharmacist', '/products?limit=100', '/manage_orders'],
+    'Customer': ['/customer', '/products?limit=100', '/view_order_history'],
+}
+
+
+def seed(product_count, order_count, rng):
+    conn = pharmacy.get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO products (name, description, price, stock_quantity, category) VALUES (%s, %s, %s, %s, %s)",
+        [(f'Product {i}', f'Synthetic product number {i}', round(rng.uniform(1, 120), 2), 10 ** 6,
+          rng.choice(['Pain Relief', 'Allergy', 'Supplements'])) for i in range(product_count)])
+    conn.commit()
+    cursor.execute("SELECT id FROM products")
+    product_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    customer_id = pharmacy.db.users.find_by_username(ACCOUNTS['Customer'][0])['id']
+    for _ in range(order_count):
+        lines = {product_id: rng.randint(1, 3) for product_id in rng.sample(product_ids, 3)}
+        pharmacy.db.orders.place(customer_id, lines)
+
+
+def time_page(client, path, requests):
+    timings = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        response = client.get(path)
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200, (path, response.status_code)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark page and fragment caching')
+    parser.add_argument('--products', type=int, default=100)
+    parser.add_argument('--orders', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200, help='requests per page and setting')
+    args = parser.parse_args()
+
+    pharmacy.app.config.update(DB_BACKEND='sqlite', SQLITE_PATH=':memory:', SESSION_BACKEND='memory',
+                               OUTBOX_EMBEDDED_WORKER=False)
+    seed(args.products, args.orders, random.Random(42))
+
+    clients = {None: pharmacy.app.test_client()}
+    for role, (username, password) in ACCOUNTS.items():
+        clients[role] = pharmacy.app.test_client()
+        clients[role].post('/login', data={'username': username, 'password': password})
+
+    print(f"{'role':<10} | {'page':<24} | {'uncached ms':>11} | {'cached ms':>9} | {'speedup':>7}")
+    print('-' * 74)
+    for role, client in clients.items():
+        for path in STATIC_PAGES + PAGES.get(role, []):
+            pharmacy.app.config['RENDER_CACHE_ENABLED'] = False
+            client.get(path)
+            uncached = time_page(client, path, args.requests)
+            pharmacy.app.config['RENDER_CACHE_ENABLED'] = True
+            client.get(path)
+            cached = time_page(client, path, args.requests)
+            print(f"{role or 'anonymous':<10} | {path.split('?')[0]:<24} | {uncached:>11.3f} | {cached:>9.3f} | "
+                  f"{uncached / cached:>6.1f}x")
+    print(pharmacy.get_render_cache().stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+# In-process cache bounded by entry count (least recently used goes first)
+# and by age. Safe to share between request threads.
+class LRUCache:
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get_many(self, keys):
+        found = {}
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if entry[0] < now:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, values, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Same interface backed by Redis (or anything speaking its protocol), so
+# every worker process sees the same entries and the same invalidations.
+# Redis enforces the size bound itself through its maxmemory policy.
+class RedisCache:
+    def __init__(self, url, ttl=300, prefix='pharmacy:'):
+        if redis is None:
+            raise RuntimeError('The redis package is required for CATALOG_CACHE_REDIS_URL')
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._client.mget([self.prefix + key for key in keys])
+        return {key: pickle.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, values, ttl=None):
+        pipe = self._client.pipeline()
+        for key, value in values.items():
+            pipe.set(self.prefix + key, pickle.dumps(value), ex=self.ttl if ttl is None else ttl)
+        pipe.execute()
+
+    def delete_many(self, keys):
+        keys = [self.prefix + key for key in keys]
+        if keys:
+            self._client.delete(*keys)
+
+    def clear(self):
+        keys = list(self._client.scan_iter(self.prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+    def __len__(self):
+        return sum(1 for _ in self._client.scan_iter(self.prefix + '*'))
+
+
+# Read-through cache for catalog data. Callers pass a loader for whatever
+# is missing; write paths call the invalidate_* methods after committing.
+class CatalogCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _count(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def get(self, key, loader):
+        found = self.backend.get_many([key])
+        if key in found:
+            self._count(1, 0)
+            return found[key]
+        self._count(0, 1)
+        value = loader()
+        self.backend.set_many({key: value})
+        return value
+
+    # Look up products by id; loader(missing_ids) returns {id: row} for the misses in one go
+    def get_products(self, product_ids, loader):
+        keys = {product_id: f'product:{product_id}' for product_id in product_ids}
+        found = self.backend.get_many(keys.values())
+        products = {product_id: found[key] for product_id, key in keys.items() if key in found}
+        missing = [product_id for product_id in keys if product_id not in products]
+        self._count(len(products), len(missing))
+        if missing:
+            loaded = loader(missing)
+            self.backend.set_many({keys[product_id]: row for product_id, row in loaded.items()})
+            products.update(loaded)
+        return products
+
+    # Token that changes whenever a listing can change: a product added,
+    # deleted, or changed in a column listings filter or sort on. It is the
+    # time of the change in ns. Listing and search results are cached under
+    # keys that include it, so bumping it retires them all at once; the
+    # stale entries simply age out.
+    def version(self):
+        found = self.backend.get_many(['catalog_version'])
+        if 'catalog_version' in found:
+            return found['catalog_version']
+        return self._bump_version()
+
+    def _bump_version(self):
+        version = time.time_ns()
+        self.backend.set_many({'catalog_version': version}, ttl=86400)
+        return version
+
+    # {id: token} like version(), one per product, for what shows a single
+    # product: its row, rating summary and review pages. A missing token is
+    # made afresh rather than assumed old, so an evicted one cannot bring a
+    # stale entry back.
+    def product_versions(self, product_ids):
+        keys = {product_id: f'product_version:{product_id}' for product_id in product_ids}
+        found = self.backend.get_many(keys.values())
+        versions = {product_id: found[key] for product_id, key in keys.items() if key in found}
+        missing = [product_id for product_id in keys if product_id not in versions]
+        if missing:
+            versions.update(self._bump_products(missing))
+        return versions
+
+    def _bump_products(self, product_ids):
+        version = time.time_ns()
+        self.backend.set_many({f'product_version:{product_id}': version for product_id in product_ids}, ttl=86400)
+        return dict.fromkeys(product_ids, version)
+
+    # A product was added or deleted, or changed in a way that can move it
+    # in or out of listings or reorder them
+    def invalidate_products(self, product_ids):
+        self.backend.delete_many([f'product:{product_id}' for product_id in product_ids] + ['categories'])
+        self._bump_products(product_ids)
+        self._bump_version()
+        with self._lock:
+            self.invalidations += 1
+
+    # Only the products' own data changed (stock, sales, ratings): their
+    # entries go, and listings keep theirs, which hold ids, not rows
+    def invalidate_rows(self, product_ids):
+        if not product_ids:
+            return
+        self.backend.delete_many([f'product:{product_id}' for product_id in product_ids])
+        self._bump_products(product_ids)
+        with self._lock:
+            self.invalidations += 1
+
+    def invalidate_ratings(self, product_id):
+        self.backend.delete_many([f'ratings:{product_id}'])
+        self.invalidate_rows([product_id])
+
+    def clear(self):
+        self.backend.clear()
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'entries': len(self.backend),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.backend.evictions,
+                'invalidations': self.invalidations,
+            }
+
+
+# Rendered HTML (whole pages and template fragments). Keys are prefixed with
+# a release token, so a deploy that changes any template or asset starts
+# from an empty cache even when the backend is shared.
+class RenderCache:
+    def __init__(self, backend, release):
+        self.backend = backend
+        self.release = release
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        found = self.backend.get_many([f'{self.release}:{key}'])
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return next(iter(found.values()), None)
+
+    def set(self, key, html):
+        self.backend.set_many({f'{self.release}:{key}': html})
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': type(self.backend).__name__,
+                'release': self.release,
+                'entries': len(self.backend),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.backend.evictions,
+            }
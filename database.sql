@@ -24,31 +24,68 @@ CREATE TABLE `orders` (
   `total_amount` decimal(10,2) NOT NULL
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
+CREATE TABLE `order_events` (
+  `id` int(11) NOT NULL,
+  `order_id` int(11) NOT NULL,
+  `event_type` varchar(50) NOT NULL,
+  `payload` text NOT NULL,
+  `created_at` datetime NOT NULL,
+  `status` enum('pending','done','failed') NOT NULL DEFAULT 'pending',
+  `attempts` int(11) NOT NULL DEFAULT 0,
+  `available_at` datetime NOT NULL,
+  `locked_by` varchar(100) DEFAULT NULL,
+  `locked_until` datetime DEFAULT NULL,
+  `processed_at` datetime DEFAULT NULL,
+  `last_error` text DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `order_event_handlers` (
+  `event_id` int(11) NOT NULL,
+  `handler` varchar(50) NOT NULL,
+  `processed_at` datetime NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
 CREATE TABLE `products` (
   `id` int(11) NOT NULL,
+  `sku` varchar(64) DEFAULT NULL,
   `name` varchar(100) NOT NULL,
   `description` text DEFAULT NULL,
   `price` decimal(10,2) NOT NULL,
   `stock_quantity` int(11) NOT NULL,
-  `category` varchar(255) DEFAULT NULL
+  `category` varchar(255) DEFAULT NULL,
+  `reorder_level` int(11) DEFAULT NULL,
+  `units_sold` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0.00,
+  `stock_shards` int(11) NOT NULL DEFAULT 0
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
-INSERT INTO `products` (`id`, `name`, `description`, `price`, `stock_quantity`, `category`) VALUES
-(1, 'Aspirin', 'Pain reliever and fever reducer', 5.00, 100, 'Pain Relief'),
-(2, 'Paracetamol', 'Commonly used for mild pain and fever', 3.50, 200, 'Pain Relief'),
-(3, 'Ibuprofen', 'Non-steroidal anti-inflammatory drug', 7.00, 150, 'Pain Relief'),
-(4, 'Cetirizine', 'Used to treat hay fever and allergy symptoms', 8.00, 120, 'Allergy'),
-(5, 'Loratadine', 'Antihistamine that reduces allergy symptoms', 6.50, 130, 'Allergy'),
-(6, 'Insulin', 'Essential for managing blood sugar levels in diabetes', 45.00, 80, 'Diabetes Care'),
-(7, 'Metformin', 'Helps control high blood sugar associated with type 2 diabetes', 20.00, 100, 'Diabetes Care'),
-(8, 'Amoxicillin', 'Antibiotic used to treat a wide variety of bacterial infections', 12.00, 95, 'Antibiotics'),
-(9, 'Doxycycline', 'Antibiotic used to treat bacterial infections, acne, and more', 18.00, 90, 'Antibiotics'),
-(10, 'Multivitamins', 'Supplements containing various vitamins and minerals', 15.00, 300, 'Supplements'),
-(11, 'Omega-3', 'Fish oil supplement beneficial for heart health', 25.00, 200, 'Supplements'),
-(12, 'Calcium', 'Important for bone health and maintaining bone density', 10.00, 180, 'Supplements'),
-(13, 'Cough Syrup', 'Provides relief from coughing and sore throat', 9.00, 110, 'Cold and Flu'),
-(14, 'Nasal Spray', 'Helps relieve nasal congestion', 11.00, 85, 'Cold and Flu'),
-(15, 'Thermometer', 'Digital device for measuring body temperature', 14.00, 60, 'Medical Devices');
+INSERT INTO `products` (`id`, `sku`, `name`, `description`, `price`, `stock_quantity`, `category`) VALUES
+(1, 'PH-00001', 'Aspirin', 'Pain reliever and fever reducer', 5.00, 100, 'Pain Relief'),
+(2, 'PH-00002', 'Paracetamol', 'Commonly used for mild pain and fever', 3.50, 200, 'Pain Relief'),
+(3, 'PH-00003', 'Ibuprofen', 'Non-steroidal anti-inflammatory drug', 7.00, 150, 'Pain Relief'),
+(4, 'PH-00004', 'Cetirizine', 'Used to treat hay fever and allergy symptoms', 8.00, 120, 'Allergy'),
+(5, 'PH-00005', 'Loratadine', 'Antihistamine that reduces allergy symptoms', 6.50, 130, 'Allergy'),
+(6, 'PH-00006', 'Insulin', 'Essential for managing blood sugar levels in diabetes', 45.00, 80, 'Diabetes Care'),
+(7, 'PH-00007', 'Metformin', 'Helps control high blood sugar associated with type 2 diabetes', 20.00, 100, 'Diabetes Care'),
+(8, 'PH-00008', 'Amoxicillin', 'Antibiotic used to treat a wide variety of bacterial infections', 12.00, 95, 'Antibiotics'),
+(9, 'PH-00009', 'Doxycycline', 'Antibiotic used to treat bacterial infections, acne, and more', 18.00, 90, 'Antibiotics'),
+(10, 'PH-00010', 'Multivitamins', 'Supplements containing various vitamins and minerals', 15.00, 300, 'Supplements'),
+(11, 'PH-00011', 'Omega-3', 'Fish oil supplement beneficial for heart health', 25.00, 200, 'Supplements'),
+(12, 'PH-00012', 'Calcium', 'Important for bone health and maintaining bone density', 10.00, 180, 'Supplements'),
+(13, 'PH-00013', 'Cough Syrup', 'Provides relief from coughing and sore throat', 9.00, 110, 'Cold and Flu'),
+(14, 'PH-00014', 'Nasal Spray', 'Helps relieve nasal congestion', 11.00, 85, 'Cold and Flu'),
+(15, 'PH-00015', 'Thermometer', 'Digital device for measuring body temperature', 14.00, 60, 'Medical Devices');
+
+CREATE TABLE `product_ratings` (
+  `product_id` int(11) NOT NULL,
+  `rating_count` int(11) NOT NULL DEFAULT 0,
+  `rating_sum` int(11) NOT NULL DEFAULT 0,
+  `rating_1` int(11) NOT NULL DEFAULT 0,
+  `rating_2` int(11) NOT NULL DEFAULT 0,
+  `rating_3` int(11) NOT NULL DEFAULT 0,
+  `rating_4` int(11) NOT NULL DEFAULT 0,
+  `rating_5` int(11) NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 CREATE TABLE `reviews` (
   `id` int(11) NOT NULL,
@@ -59,6 +96,38 @@ CREATE TABLE `reviews` (
   `created_at` timestamp NOT NULL DEFAULT current_timestamp()
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
+CREATE TABLE `sales_daily` (
+  `period_start` date NOT NULL,
+  `category` varchar(255) NOT NULL DEFAULT '',
+  `order_count` int(11) NOT NULL DEFAULT 0,
+  `units_sold` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0.00
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `sales_hourly` (
+  `period_start` datetime NOT NULL,
+  `category` varchar(255) NOT NULL DEFAULT '',
+  `order_count` int(11) NOT NULL DEFAULT 0,
+  `units_sold` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0.00
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `stock_reservations` (
+  `id` int(11) NOT NULL,
+  `user_id` int(11) NOT NULL,
+  `product_id` int(11) NOT NULL,
+  `quantity` int(11) NOT NULL,
+  `expires_at` datetime NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `stock_shards` (
+  `product_id` int(11) NOT NULL,
+  `shard` int(11) NOT NULL,
+  `stock_quantity` int(11) NOT NULL DEFAULT 0,
+  `units_sold` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0.00
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
 CREATE TABLE `users` (
   `id` int(11) NOT NULL,
   `username` varchar(50) NOT NULL,
@@ -69,7 +138,8 @@ CREATE TABLE `users` (
   `last_name` varchar(255) DEFAULT NULL,
   `date_of_birth` date DEFAULT NULL,
   `gender` enum('Male','Female','Other') DEFAULT NULL,
-  `phone_number` varchar(20) DEFAULT NULL
+  `phone_number` varchar(20) DEFAULT NULL,
+  `is_active` tinyint(1) NOT NULL DEFAULT 1
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
 
 INSERT INTO `users` (`id`, `username`, `email`, `password`, `role`, `first_name`, `last_name`, `date_of_birth`, `gender`, `phone_number`) VALUES
@@ -85,19 +155,59 @@ ALTER TABLE `orderitems`
 
 ALTER TABLE `orders`
   ADD PRIMARY KEY (`id`),
-  ADD KEY `customer_id` (`customer_id`);
+  ADD KEY `customer_id` (`customer_id`),
+  ADD KEY `customer_order_date` (`customer_id`, `order_date`, `id`),
+  ADD KEY `status_order_date` (`status`, `order_date`, `id`),
+  ADD KEY `order_date` (`order_date`, `id`);
+
+ALTER TABLE `order_events`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `status_available` (`status`, `available_at`, `id`),
+  ADD KEY `order_id` (`order_id`);
+
+ALTER TABLE `order_event_handlers`
+  ADD PRIMARY KEY (`event_id`, `handler`);
 
 ALTER TABLE `products`
-  ADD PRIMARY KEY (`id`);
+  ADD PRIMARY KEY (`id`),
+  ADD UNIQUE KEY `sku` (`sku`),
+  ADD KEY `category` (`category`),
+  ADD KEY `name` (`name`, `id`),
+  ADD KEY `price` (`price`, `id`),
+  ADD KEY `stock_shards` (`stock_shards`),
+  ADD FULLTEXT KEY `name_description` (`name`, `description`);
+
+ALTER TABLE `product_ratings`
+  ADD PRIMARY KEY (`product_id`);
 
 ALTER TABLE `reviews`
   ADD PRIMARY KEY (`id`),
-  ADD KEY `user_id` (`user_id`),
+  ADD UNIQUE KEY `user_product` (`user_id`, `product_id`),
+  ADD KEY `product_created` (`product_id`, `created_at`, `id`);
+
+ALTER TABLE `sales_daily`
+  ADD PRIMARY KEY (`period_start`, `category`);
+
+ALTER TABLE `sales_hourly`
+  ADD PRIMARY KEY (`period_start`, `category`);
+
+ALTER TABLE `stock_reservations`
+  ADD PRIMARY KEY (`id`),
+  ADD UNIQUE KEY `user_product` (`user_id`, `product_id`),
+  ADD KEY `expires_at` (`expires_at`, `id`),
   ADD KEY `product_id` (`product_id`);
 
+ALTER TABLE `stock_shards`
+  ADD PRIMARY KEY (`product_id`, `shard`);
+
 ALTER TABLE `users`
   ADD PRIMARY KEY (`id`),
-  ADD UNIQUE KEY `email` (`email`);
+  ADD UNIQUE KEY `username` (`username`),
+  ADD UNIQUE KEY `email` (`email`),
+  ADD KEY `role` (`role`, `id`),
+  ADD KEY `phone_number` (`phone_number`),
+  ADD KEY `first_name` (`first_name`),
+  ADD KEY `last_name` (`last_name`);
 
 
 ALTER TABLE `orderitems`
@@ -106,12 +216,18 @@ ALTER TABLE `orderitems`
 ALTER TABLE `orders`
   MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
 
+ALTER TABLE `order_events`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+
 ALTER TABLE `products`
   MODIFY `id` int(11) NOT NULL AUTO_INCREMENT, AUTO_INCREMENT=16;
 
 ALTER TABLE `reviews`
   MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
 
+ALTER TABLE `stock_reservations`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+
 ALTER TABLE `users`
   MODIFY `id` int(11) NOT NULL AUTO_INCREMENT, AUTO_INCREMENT=4;
 
@@ -123,9 +239,24 @@ ALTER TABLE `orderitems`
 ALTER TABLE `orders`
   ADD CONSTRAINT `orders_ibfk_1` FOREIGN KEY (`customer_id`) REFERENCES `users` (`id`);
 
+ALTER TABLE `order_events`
+  ADD CONSTRAINT `order_events_ibfk_1` FOREIGN KEY (`order_id`) REFERENCES `orders` (`id`);
+
+ALTER TABLE `order_event_handlers`
+  ADD CONSTRAINT `order_event_handlers_ibfk_1` FOREIGN KEY (`event_id`) REFERENCES `order_events` (`id`) ON DELETE CASCADE;
+
+ALTER TABLE `product_ratings`
+  ADD CONSTRAINT `product_ratings_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE;
+
 ALTER TABLE `reviews`
   ADD CONSTRAINT `reviews_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`),
   ADD CONSTRAINT `reviews_ibfk_2` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`);
+
+ALTER TABLE `stock_reservations`
+  ADD CONSTRAINT `stock_reservations_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE;
+
+ALTER TABLE `stock_shards`
+  ADD CONSTRAINT `stock_shards_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE;
 COMMIT;
 
 /*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;
@@ -0,0 +1,205 @@
+-- Upgrades a MySQL database created from the original database.sql to the
+-- current schema. Run it once, after a backup, e.g.
+--
+--   mysql -u your_db_user -p your_db_name < database_upgrade.sql
+--
+-- then fill the new summary tables and counters from the existing data:
+--
+--   flask --app app rebuild-ratings
+--   flask --app app rebuild-sales-rollups
+--   flask --app app reconcile-inventory --fix
+
+SET time_zone = "+00:00";
+
+/*!40101 SET @OLD_CHARACTER_SET_CLIENT=@@CHARACTER_SET_CLIENT */;
+/*!40101 SET @OLD_CHARACTER_SET_RESULTS=@@CHARACTER_SET_RESULTS */;
+/*!40101 SET @OLD_COLLATION_CONNECTION=@@COLLATION_CONNECTION */;
+/*!40101 SET NAMES utf8mb4 */;
+
+
+-- New columns
+
+ALTER TABLE `products`
+  ADD COLUMN `sku` varchar(64) DEFAULT NULL AFTER `id`,
+  ADD COLUMN `reorder_level` int(11) DEFAULT NULL,
+  ADD COLUMN `units_sold` int(11) NOT NULL DEFAULT 0,
+  ADD COLUMN `revenue` decimal(14,2) NOT NULL DEFAULT 0.00,
+  ADD COLUMN `stock_shards` int(11) NOT NULL DEFAULT 0;
+
+ALTER TABLE `users`
+  ADD COLUMN `is_active` tinyint(1) NOT NULL DEFAULT 1;
+
+
+-- Data the new unique keys would reject
+
+-- Usernames are unique from now on. The oldest account keeps its name; later
+-- ones with the same name (compared like the key does, ignoring case) are
+-- renamed to <name>-dup-<id> and deactivated. They are not deleted, so their
+-- orders and reviews stay; an admin can rename and reactivate them.
+UPDATE `users` u
+JOIN (
+  SELECT `username`, MIN(`id`) AS `keep_id` FROM `users` GROUP BY `username` HAVING COUNT(*) > 1
+) d ON d.`username` = u.`username` AND u.`id` > d.`keep_id`
+SET u.`username` = CONCAT(LEFT(u.`username`, 34), '-dup-', u.`id`),
+    u.`is_active` = 0;
+
+-- A customer has one review per product: keep the latest
+DELETE r FROM `reviews` r
+JOIN `reviews` newer ON newer.`user_id` = r.`user_id` AND newer.`product_id` = r.`product_id`
+  AND (newer.`created_at` > r.`created_at` OR newer.`created_at` = r.`created_at` AND newer.`id` > r.`id`);
+
+-- Existing products get the SKUs the seed data uses, so the CSV import can match them
+UPDATE `products` SET `sku` = CONCAT('PH-', LPAD(`id`, GREATEST(5, CHAR_LENGTH(`id`)), '0')) WHERE `sku` IS NULL;
+
+
+-- New tables
+
+CREATE TABLE `order_events` (
+  `id` int(11) NOT NULL,
+  `order_id` int(11) NOT NULL,
+  `event_type` varchar(50) NOT NULL,
+  `payload` text NOT NULL,
+  `created_at` datetime NOT NULL,
+  `status` enum('pending','done','failed') NOT NULL DEFAULT 'pending',
+  `attempts` int(11) NOT NULL DEFAULT 0,
+  `available_at` datetime NOT NULL,
+  `locked_by` varchar(100) DEFAULT NULL,
+  `locked_until` datetime DEFAULT NULL,
+  `processed_at` datetime DEFAULT NULL,
+  `last_error` text DEFAULT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `order_event_handlers` (
+  `event_id` int(11) NOT NULL,
+  `handler` varchar(50) NOT NULL,
+  `processed_at` datetime NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `product_ratings` (
+  `product_id` int(11) NOT NULL,
+  `rating_count` int(11) NOT NULL DEFAULT 0,
+  `rating_sum` int(11) NOT NULL DEFAULT 0,
+  `rating_1` int(11) NOT NULL DEFAULT 0,
+  `rating_2` int(11) NOT NULL DEFAULT 0,
+  `rating_3` int(11) NOT NULL DEFAULT 0,
+  `rating_4` int(11) NOT NULL DEFAULT 0,
+  `rating_5` int(11) NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `sales_daily` (
+  `period_start` date NOT NULL,
+  `category` varchar(255) NOT NULL DEFAULT '',
+  `order_count` int(11) NOT NULL DEFAULT 0,
+  `units_sold` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0.00
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `sales_hourly` (
+  `period_start` datetime NOT NULL,
+  `category` varchar(255) NOT NULL DEFAULT '',
+  `order_count` int(11) NOT NULL DEFAULT 0,
+  `units_sold` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0.00
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `stock_reservations` (
+  `id` int(11) NOT NULL,
+  `user_id` int(11) NOT NULL,
+  `product_id` int(11) NOT NULL,
+  `quantity` int(11) NOT NULL,
+  `expires_at` datetime NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+CREATE TABLE `stock_shards` (
+  `product_id` int(11) NOT NULL,
+  `shard` int(11) NOT NULL,
+  `stock_quantity` int(11) NOT NULL DEFAULT 0,
+  `units_sold` int(11) NOT NULL DEFAULT 0,
+  `revenue` decimal(14,2) NOT NULL DEFAULT 0.00
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;
+
+
+-- Keys
+
+ALTER TABLE `orders`
+  ADD KEY `customer_order_date` (`customer_id`, `order_date`, `id`),
+  ADD KEY `status_order_date` (`status`, `order_date`, `id`),
+  ADD KEY `order_date` (`order_date`, `id`);
+
+ALTER TABLE `order_events`
+  ADD PRIMARY KEY (`id`),
+  ADD KEY `status_available` (`status`, `available_at`, `id`),
+  ADD KEY `order_id` (`order_id`);
+
+ALTER TABLE `order_event_handlers`
+  ADD PRIMARY KEY (`event_id`, `handler`);
+
+ALTER TABLE `products`
+  ADD UNIQUE KEY `sku` (`sku`),
+  ADD KEY `category` (`category`),
+  ADD KEY `name` (`name`, `id`),
+  ADD KEY `price` (`price`, `id`),
+  ADD KEY `stock_shards` (`stock_shards`),
+  ADD FULLTEXT KEY `name_description` (`name`, `description`);
+
+ALTER TABLE `product_ratings`
+  ADD PRIMARY KEY (`product_id`);
+
+-- The new keys are added before the old ones go, so the foreign keys on
+-- user_id and product_id always have an index to use
+ALTER TABLE `reviews`
+  ADD UNIQUE KEY `user_product` (`user_id`, `product_id`),
+  ADD KEY `product_created` (`product_id`, `created_at`, `id`);
+
+ALTER TABLE `reviews`
+  DROP KEY `user_id`,
+  DROP KEY `product_id`;
+
+ALTER TABLE `sales_daily`
+  ADD PRIMARY KEY (`period_start`, `category`);
+
+ALTER TABLE `sales_hourly`
+  ADD PRIMARY KEY (`period_start`, `category`);
+
+ALTER TABLE `stock_reservations`
+  ADD PRIMARY KEY (`id`),
+  ADD UNIQUE KEY `user_product` (`user_id`, `product_id`),
+  ADD KEY `expires_at` (`expires_at`, `id`),
+  ADD KEY `product_id` (`product_id`);
+
+ALTER TABLE `stock_shards`
+  ADD PRIMARY KEY (`product_id`, `shard`);
+
+ALTER TABLE `users`
+  ADD UNIQUE KEY `username` (`username`),
+  ADD KEY `role` (`role`, `id`),
+  ADD KEY `phone_number` (`phone_number`),
+  ADD KEY `first_name` (`first_name`),
+  ADD KEY `last_name` (`last_name`);
+
+
+ALTER TABLE `order_events`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+
+ALTER TABLE `stock_reservations`
+  MODIFY `id` int(11) NOT NULL AUTO_INCREMENT;
+
+
+ALTER TABLE `order_events`
+  ADD CONSTRAINT `order_events_ibfk_1` FOREIGN KEY (`order_id`) REFERENCES `orders` (`id`);
+
+ALTER TABLE `order_event_handlers`
+  ADD CONSTRAINT `order_event_handlers_ibfk_1` FOREIGN KEY (`event_id`) REFERENCES `order_events` (`id`) ON DELETE CASCADE;
+
+ALTER TABLE `product_ratings`
+  ADD CONSTRAINT `product_ratings_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE;
+
+ALTER TABLE `stock_reservations`
+  ADD CONSTRAINT `stock_reservations_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE;
+
+ALTER TABLE `stock_shards`
+  ADD CONSTRAINT `stock_shards_ibfk_1` FOREIGN KEY (`product_id`) REFERENCES `products` (`id`) ON DELETE CASCADE;
+
+/*!40101 SET CHARACTER_SET_CLIENT=@OLD_CHARACTER_SET_CLIENT */;
+/*!40101 SET CHARACTER_SET_RESULTS=@OLD_CHARACTER_SET_RESULTS */;
+/*!40101 SET COLLATION_CONNECTION=@OLD_COLLATION_CONNECTION */;
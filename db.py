@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# A checked-out connection. Everything is delegated to the raw DB-API
+# connection except close(), which hands the connection back to the pool.
+class PooledConnection:
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._pool._release(self)
+
+    def invalidate(self):
+        # Drop the underlying connection instead of returning it to the pool
+        if not self._released:
+            self._released = True
+            self._pool._release(self, discard=True)
+
+
+class ConnectionPool:
+    def __init__(self, creator, size=5, max_overflow=10, timeout=30.0, recycle=3600, pre_ping=True):
+        self._creator = creator
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+
+        self._idle = deque()  # (raw connection, created_at)
+        self._open = 0        # connections currently alive, idle or in use
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._invalidated = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+
+    def connect(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+
+        with self._available:
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._open < self.size + self.max_overflow:
+                    raw, created_at = None, None
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        'Connection pool exhausted (%d in use, timeout %.1fs)' % (self._in_use, self.timeout))
+                waited = True
+                self._available.wait(remaining)
+            self._in_use += 1
+            if waited:
+                self._waits += 1
+
+        try:
+            if raw is not None and self._is_stale(raw, created_at):
+                self._close_raw(raw)
+                raw = None
+            if raw is None:
+                raw = self._creator()
+                created_at = time.monotonic()
+                with self._lock:
+                    self._created += 1
+        except Exception:
+            with self._available:
+                self._open -= 1
+                self._in_use -= 1
+                self._available.notify()
+            raise
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self._checkouts += 1
+            self._checkout_time_total += elapsed
+            self._checkout_time_max = max(self._checkout_time_max, elapsed)
+        return PooledConnection(self, raw, created_at)
+
+    def _is_stale(self, raw, created_at):
+        if self.recycle is not None and self.recycle >= 0 and time.monotonic() - created_at > self.recycle:
+            with self._lock:
+                self._recycled += 1
+            return True
+        if self.pre_ping and not self._ping(raw):
+            with self._lock:
+                self._invalidated += 1
+            return True
+        return False
+
+    @staticmethod
+    def _ping(raw):
+        try:
+            # mysql.connector exposes is_connected(); anything else (sqlite3) gets a trivial query
+            if hasattr(raw, 'is_connected'):
+                return raw.is_connected()
+            cursor = raw.cursor()
+            try:
+                cursor.execute('SELECT 1')
+                cursor.fetchall()
+            finally:
+                cursor.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_raw(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _release(self, conn, discard=False):
+        raw = conn._raw
+        if not discard:
+            # Never hand the next caller a half-finished transaction
+            try:
+                raw.rollback()
+            except Exception:
+                discard = True
+
+        with self._available:
+            self._in_use -= 1
+            if discard or len(self._idle) >= self.size:
+                self._open -= 1
+                if discard:
+                    self._invalidated += 1
+            else:
+                self._idle.append((raw, conn._created_at))
+                raw = None
+            self._available.notify()
+
+        if raw is not None:
+            self._close_raw(raw)
+
+    def dispose(self):
+        # Close every idle connection; checked-out ones are closed as they come back
+        with self._available:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._open -= len(idle)
+        for raw, _ in idle:
+            self._close_raw(raw)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'overflow': max(0, self._open - self.size),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'recycled': self._recycled,
+                'invalidated': self._invalidated,
+                'checkout_ms_avg': round(1000 * self._checkout_time_total / self._checkouts, 3) if self._checkouts else 0.0,
+                'checkout_ms_max': round(1000 * self._checkout_time_max, 3),
+            }
+
+
+# Connection shared by everything that runs inside one Flask app context.
+# Route code keeps calling close() as before; the real release happens once
+# at teardown.
+class ScopedConnection:
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        pass
+
+    def release(self):
+        self._conn.close()
+
+    # Release the connection by dropping it instead of pooling it again
+    def invalidate(self):
+        self._conn.invalidate()
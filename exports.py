@@ -0,0 +1,42 @@
+import csv
+import io
+import json
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+EXPORT_CHUNK_SIZE = 1000
+
+
+# Pull rows off an unbuffered cursor a chunk at a time so only one chunk is
+# ever held in memory, however large the result set is
+def cursor_chunks(cursor, chunk_size=EXPORT_CHUNK_SIZE):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield rows
+
+
+def list_chunks(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    for start in range(0, len(rows), chunk_size):
+        yield rows[start:start + chunk_size]
+
+
+# Serialise chunks of row tuples as CSV (with a header line) or NDJSON,
+# yielding one string per chunk for a streaming response
+def serialize_chunks(columns, chunks, fmt):
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        yield buffer.getvalue()
+        for rows in chunks:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerows(rows)
+            yield buffer.getvalue()
+    else:
+        for rows in chunks:
+            yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in rows)
@@ -0,0 +1,63 @@
+import re
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+# Template-side pieces of the render cache.
+#
+#   {% cache 'product-row', product.id, product_versions[product.id], role %} ... {% endcache %}
+#
+# caches the enclosed block under the template, the line and the given key
+# parts; environment.fragment_cache is a callable returning the cache (with
+# get/set) or None, in which case the block simply renders.
+#
+# A whole page is cached with holes for anything that differs per user or per
+# request: cache_hole_marker(name) leaves <!--cache-hole:name--> in the cached
+# copy and fill_holes puts the live value there on every response.
+_HOLE = re.compile(r'<!--cache-hole:([a-z_]+)-->')
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        name = nodes.Const(f'{parser.name}:{lineno}')
+        call = self.call_method('_render', [name, nodes.List(parts)])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _render(self, name, parts, caller):
+        cache = self.environment.fragment_cache() if self.environment.fragment_cache else None
+        if cache is None:
+            return caller()
+        key = f"fragment:{name}:{':'.join(str(part) for part in parts)}"
+        html = cache.get(key)
+        if html is None:
+            html = str(caller())
+            cache.set(key, html)
+        return Markup(html)
+
+
+def cache_hole_marker(name):
+    return Markup(f'<!--cache-hole:{name}-->')
+
+
+# Replace every hole in a cached page with holes[name](); each runs at most once
+def fill_holes(html, holes):
+    filled = {}
+
+    def replace(match):
+        name = match.group(1)
+        if name not in filled:
+            filled[name] = str(holes[name]())
+        return filled[name]
+    return _HOLE.sub(replace, html)
@@ -0,0 +1,96 @@
+import csv
+import io
+from decimal import Decimal, InvalidOperation
+
+# Product CSV import. The header names the columns; sku, name, price and
+# stock_quantity are required, and description, category and reorder_level
+# are only written when the file has them, so a price-and-stock file leaves
+# the rest of each product as it is.
+IMPORT_REQUIRED_COLUMNS = ('sku', 'name', 'price', 'stock_quantity')
+IMPORT_OPTIONAL_COLUMNS = ('description', 'category', 'reorder_level')
+IMPORT_BATCH_SIZE = 500
+# Longest value each text column holds in database.sql
+_MAX_LENGTHS = {'sku': 64, 'name': 100, 'category': 255}
+
+
+class ImportFileError(Exception):
+    pass
+
+
+def _integer(value, column):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f'{column} must be a whole number') from None
+    if number < 0:
+        raise ValueError(f'{column} cannot be negative')
+    return number
+
+
+# One CSV record as product fields, or ValueError naming what is wrong with it
+def parse_product_row(record, columns):
+    row = {column: (record.get(column) or '').strip() for column in columns}
+    for column in IMPORT_REQUIRED_COLUMNS:
+        if not row[column]:
+            raise ValueError(f'{column} is required')
+    for column, length in _MAX_LENGTHS.items():
+        if column in row and len(row[column]) > length:
+            raise ValueError(f'{column} is longer than {length} characters')
+    try:
+        price = Decimal(row['price'])
+    except InvalidOperation:
+        raise ValueError('price must be a number') from None
+    if not price.is_finite() or price < 0 or price != price.quantize(Decimal('0.01')) or price >= 10 ** 8:
+        raise ValueError('price must be a non-negative amount with at most two decimal places')
+    row['price'] = price.quantize(Decimal('0.01'))
+    row['stock_quantity'] = _integer(row['stock_quantity'], 'stock_quantity')
+    if 'reorder_level' in row:
+        row['reorder_level'] = _integer(row['reorder_level'], 'reorder_level') if row['reorder_level'] else None
+    for column in ('description', 'category'):
+        if column in row:
+            row[column] = row[column] or None
+    return row
+
+
+# Read a product CSV from a binary or text stream one record at a time.
+# Returns the columns it carries and a generator of (line, row, error)
+# where exactly one of row and error is set. A SKU seen earlier in the file
+# is an error, so every SKU is written at most once per import.
+def read_product_csv(stream):
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(stream)
+    header = [(name or '').strip().lower() for name in reader.fieldnames or []]
+    missing = [column for column in IMPORT_REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise ImportFileError(f"The header is missing {', '.join(missing)}")
+    unknown = [column for column in header if column not in IMPORT_REQUIRED_COLUMNS + IMPORT_OPTIONAL_COLUMNS]
+    if unknown:
+        raise ImportFileError(f"Unknown columns: {', '.join(unknown)}")
+    reader.fieldnames = header
+    columns = [column for column in IMPORT_REQUIRED_COLUMNS + IMPORT_OPTIONAL_COLUMNS if column in header]
+
+    def rows():
+        seen = set()
+        for record in reader:
+            try:
+                row = parse_product_row(record, columns)
+                if row['sku'].lower() in seen:
+                    raise ValueError(f"SKU {row['sku']} appears earlier in the file")
+                seen.add(row['sku'].lower())
+            except ValueError as err:
+                yield reader.line_num, None, {'sku': (record.get('sku') or '').strip(), 'message': str(err)}
+            else:
+                yield reader.line_num, row, None
+    return columns, rows()
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,210 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+REQUEST_DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROW_LIST = re.compile(r'\(\?\+\)(?:\s*,\s*\(\?\+\))+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+class NPlusOneQuery(Exception):
+    pass
+
+
+# Reduce a statement to its shape: literals and placeholders become ?, IN
+# lists and multi-row VALUES collapse, so the same query with different
+# arguments (or a different number of them) has one fingerprint
+def fingerprint(sql):
+    if isinstance(sql, bytes):
+        sql = sql.decode(errors='replace')
+    sql = sql.replace('%s', '?')
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _PLACEHOLDER_LIST.sub('(?+)', sql)
+    sql = _ROW_LIST.sub('(?+), ...', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+# Everything measured during one request (or one CLI command)
+class RequestStats:
+    def __init__(self, slow_query_ms=None, n_plus_one_threshold=None, n_plus_one_raise=False):
+        self.slow_query_ms = slow_query_ms
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.n_plus_one_raise = n_plus_one_raise
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.template_time = 0.0
+        self.shapes = Counter()
+        self.target_queries = Counter()  # statements per database: 'primary', 'replica-0', ...
+        self.slow_queries = 0
+        self.repeated_shapes = []
+
+    def record_query(self, sql, elapsed, target='primary'):
+        shape = fingerprint(sql)
+        self.query_count += 1
+        self.target_queries[target] += 1
+        self.db_time += elapsed
+        self.shapes[shape] += 1
+        if self.slow_query_ms is not None and elapsed * 1000 >= self.slow_query_ms:
+            self.slow_queries += 1
+            logger.warning('Slow query (%.1f ms): %s', elapsed * 1000, shape)
+        if self.n_plus_one_threshold and self.shapes[shape] == self.n_plus_one_threshold + 1:
+            # Reported once per shape, the first time it goes over the limit
+            self.repeated_shapes.append(shape)
+            message = f'Query ran more than {self.n_plus_one_threshold} times in one request: {shape}'
+            if self.n_plus_one_raise:
+                raise NPlusOneQuery(message)
+            logger.warning(message)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+# Cursor wrapper that times execute calls and counts fetched rows
+class InstrumentedCursor:
+    def __init__(self, cursor, stats, target='primary'):
+        self._cursor = cursor
+        self._stats = stats
+        self._target = target
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._stats.rows += 1
+            yield row
+
+    def execute(self, operation, params=None, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            if params is None:
+                return self._cursor.execute(operation, *args, **kwargs)
+            return self._cursor.execute(operation, params, *args, **kwargs)
+        finally:
+            self._stats.record_query(operation, time.perf_counter() - started, self._target)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            self._stats.record_query(operation, time.perf_counter() - started, self._target)
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        if row is not None:
+            self._stats.rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._stats.rows += len(rows)
+        return rows
+
+
+# Connection wrapper whose cursors all report into the same RequestStats,
+# counted under target (which database the connection goes to)
+class InstrumentedConnection:
+    def __init__(self, conn, stats, target='primary'):
+        self._conn = conn
+        self._stats = stats
+        self.target = target
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return InstrumentedCursor(self._conn.cursor(*args, **kwargs), self._stats, self.target)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+
+# Process-wide counters and histograms, rendered in the Prometheus text format
+class Metrics:
+    def __init__(self, buckets=REQUEST_DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+            histogram[-2] += 1
+            histogram[-1] += value
+
+    # {labels dict as sorted tuple: value} for one counter, e.g. for benchmarks
+    def totals(self, name):
+        with self._lock:
+            return {labels: value for (counter, labels), value in self._counters.items() if counter == name}
+
+    # gauges is {name: value} or {name: [(labels dict, value), ...]} read at scrape time
+    def render(self, gauges=None):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(values)) for key, values in self._histograms.items())
+
+        def header(name, default_kind):
+            kind, help_text = self._help.get(name, (default_kind, ''))
+            if help_text:
+                lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                header(name, 'counter')
+            lines.append(f'{name}{_format_labels(labels)} {value}')
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                header(name, 'histogram')
+            for bound, count in zip(self.buckets, histogram):
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {histogram[-2]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {histogram[-2]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {histogram[-1]}')
+        for name, value in (gauges or {}).items():
+            header(name, 'gauge')
+            samples = value if isinstance(value, list) else [({}, value)]
+            for labels, sample in samples:
+                lines.append(f'{name}{_format_labels(tuple(sorted(labels.items())))} {sample}')
+        return '\n'.join(lines) + '\n'
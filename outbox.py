@@ -0,0 +1,171 @@
+import logging
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from reports import apply_sales_rollup, order_rollup_items
+
+logger = logging.getLogger(__name__)
+
+
+# Consumes order_events in batches. Each event runs the handlers registered
+# for its type, each handler in its own transaction together with a marker
+# row, so a retried event skips the handlers that already ran and their
+# database work happens once. Anything outside the database (a receipt
+# mail) is at least once. A failing event is retried with exponential
+# backoff and parked as 'failed' after max_attempts.
+class OutboxWorker:
+    def __init__(self, db, handlers, batch_size=100, threads=4, lease_seconds=60, max_attempts=8,
+                 poll_interval=1.0, max_retry_delay=300):
+        self.db = db
+        self.handlers = handlers  # event_type -> [(name, handler(cursor, backend, event))]
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.max_retry_delay = max_retry_delay
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='outbox')
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.retried = 0
+        self.parked = 0
+
+    def _count(self, field):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def process(self, event):
+        try:
+            done = self.db.order_events.handled(event['id'])
+            for name, handler in self.handlers.get(event['event_type'], []):
+                if name in done:
+                    continue
+                with self.db.transaction(dictionary=False) as cursor:
+                    handler(cursor, self.db.backend, event)
+                    self.db.order_events.mark_handled(cursor, event['id'], name)
+            self.db.order_events.complete(event['id'], self.worker_id)
+            self._count('processed')
+        except Exception as err:
+            logger.exception('Order event %s (%s) failed', event['id'], event['event_type'])
+            delay = min(2 ** event['attempts'], self.max_retry_delay)
+            if self.db.order_events.fail(event, self.worker_id, repr(err), self.max_attempts, delay):
+                logger.error('Order event %s parked after %d attempts', event['id'], self.max_attempts)
+                self._count('parked')
+            else:
+                self._count('retried')
+
+    # Claim and process one batch; returns the number of events claimed
+    def run_once(self):
+        events = self.db.order_events.claim(self.worker_id, self.batch_size, self.lease_seconds)
+        list(self._pool.map(self.process, events))
+        return len(events)
+
+    # Poll until stop is set, going straight on while batches come back full
+    def run(self, stop):
+        while not stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception:
+                logger.exception('Outbox poll failed')
+                claimed = 0
+            if claimed < self.batch_size:
+                stop.wait(self.poll_interval)
+
+    def stats(self):
+        with self._lock:
+            return {'worker_id': self.worker_id, 'processed': self.processed,
+                    'retried': self.retried, 'parked': self.parked}
+
+
+def _order(cursor, order_id):
+    cursor.execute("""
+        SELECT o.order_date, o.total_amount, u.username, u.email
+        FROM Orders o LEFT JOIN users u ON u.id = o.customer_id
+        WHERE o.id = %s
+    """, (order_id,))
+    return cursor.fetchone()
+
+
+def _log_receipt(email, subject, body):
+    logger.info('Receipt to %s: %s\n%s', email, subject, body)
+
+
+def _log_alert(message):
+    logger.warning(message)
+
+
+# Handlers for the order events. send_receipt(email, subject, body) and
+# send_alert(message) default to the log; swap in a mailer or pager.
+def order_event_handlers(default_reorder_level, send_receipt=None, send_alert=None):
+    send_receipt = send_receipt or _log_receipt
+    send_alert = send_alert or _log_alert
+
+    # Rollup upserts are additive, so created and cancelled events may be applied in either order
+    def sales_rollup_created(cursor, backend, event):
+        order_date, total_amount, _, _ = _order(cursor, event['order_id'])
+        apply_sales_rollup(cursor, backend, order_date, total_amount,
+                           order_rollup_items(cursor, event['order_id']))
+
+    def sales_rollup_status(cursor, backend, event):
+        # Cancelled orders are left out of the sales rollups; Cancelled is final in the state machine
+        if event['payload']['to'] == 'Cancelled':
+            order_date, total_amount, _, _ = _order(cursor, event['order_id'])
+            apply_sales_rollup(cursor, backend, order_date, total_amount,
+                               order_rollup_items(cursor, event['order_id']), sign=-1)
+
+    # Alert once, for the order that takes a product to or below its reorder
+    # level, judged by the stock [before, after] the order recorded when it
+    # was placed: by the time the event is handled, later orders may have
+    # moved the stock again. Events recorded before the payload carried the
+    # stock are judged by the current stock, a split product's being the
+    # total of its shards.
+    def stock_alerts(cursor, backend, event):
+        stock = event['payload'].get('stock')
+        if stock is None:
+            cursor.execute("""
+                SELECT p.id, p.name, COALESCE(h.stock, p.stock_quantity) + oi.quantity AS before_stock,
+                       COALESCE(h.stock, p.stock_quantity) AS after_stock, COALESCE(p.reorder_level, %s)
+                FROM OrderItems oi
+                JOIN products p ON p.id = oi.product_id
+                LEFT JOIN (
+                    SELECT product_id, SUM(stock_quantity) AS stock FROM stock_shards GROUP BY product_id
+                ) h ON h.product_id = p.id
+                WHERE oi.order_id = %s
+            """, (default_reorder_level, event['order_id']))
+            rows = cursor.fetchall()
+        else:
+            product_ids = [int(product_id) for product_id in stock]
+            cursor.execute(f"""
+                SELECT id, name, COALESCE(reorder_level, %s) FROM products
+                WHERE id IN ({", ".join(["%s"] * len(product_ids))})
+            """, [default_reorder_level] + product_ids)
+            rows = [(product_id, name, *stock[str(product_id)], reorder_level)
+                    for product_id, name, reorder_level in cursor.fetchall()]
+        for product_id, name, before, after, reorder_level in rows:
+            if after <= reorder_level < before:
+                send_alert(f"Low stock: #{product_id} {name} has {after} left (reorder level {reorder_level})")
+
+    def receipt(cursor, backend, event):
+        order_date, total_amount, username, email = _order(cursor, event['order_id'])
+        cursor.execute("""
+            SELECT p.name, oi.quantity, oi.price
+            FROM OrderItems oi JOIN products p ON p.id = oi.product_id
+            WHERE oi.order_id = %s ORDER BY oi.id
+        """, (event['order_id'],))
+        lines = [f"{quantity} x {name} @ {price}" for name, quantity, price in cursor.fetchall()]
+        send_receipt(email, f"Your order #{event['order_id']}",
+                     f"Hello {username},\n\n" + "\n".join(lines) + f"\n\nTotal: {total_amount}\nPlaced: {order_date}")
+
+    def status_notification(cursor, backend, event):
+        _, _, username, email = _order(cursor, event['order_id'])
+        send_receipt(email, f"Order #{event['order_id']} is now {event['payload']['to']}",
+                     f"Hello {username},\n\nYour order #{event['order_id']} has moved from "
+                     f"{event['payload']['from']} to {event['payload']['to']}.")
+
+    return {
+        'order_created': [('sales_rollup', sales_rollup_created), ('stock_alerts', stock_alerts), ('receipt', receipt)],
+        'order_status_changed': [('sales_rollup', sales_rollup_status), ('status_notification', status_notification)],
+    }
@@ -0,0 +1,110 @@
+import base64
+import hashlib
+import hmac
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Stored format: scrypt$<n>$<r>$<p>$<salt>$<hash>, salt and hash base64 encoded.
+# Hashes written before this module are unsalted SHA-256 hex digests.
+SCRYPT_PREFIX = 'scrypt'
+SALT_BYTES = 16
+HASH_BYTES = 32
+LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p):
+    # OpenSSL needs roughly 128 * r * (n + p + 2) bytes; leave some headroom
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, dklen=HASH_BYTES,
+                          maxmem=128 * r * (n + p + 2) + 1024 * 1024)
+
+
+def hash_password(password, n=2 ** 14, r=8, p=1):
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, n, r, p)
+    return f'{SCRYPT_PREFIX}${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}'
+
+
+def verify_password(password, stored):
+    if not isinstance(password, str):
+        return False
+    if stored and LEGACY_SHA256.match(stored):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    try:
+        prefix, n, r, p, salt, digest = stored.split('$')
+        if prefix != SCRYPT_PREFIX:
+            return False
+        return hmac.compare_digest(_scrypt(password, _b64decode(salt), int(n), int(r), int(p)), _b64decode(digest))
+    except (AttributeError, ValueError):
+        return False
+
+
+# True for legacy hashes and for scrypt hashes made with other cost settings
+def needs_rehash(stored, n, r, p):
+    return not (stored or '').startswith(f'{SCRYPT_PREFIX}${n}${r}${p}$')
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+# Runs hashing and verification on a small dedicated pool, which caps how
+# many scrypt computations run at once (and so their CPU use and their
+# memory, workers * 128 * n * r bytes). The calling request thread waits for
+# its result, so the queue in front of the pool is bounded too: with
+# workers + max_queue jobs already pending, hash() and verify() raise
+# PasswordHasherBusy at once instead of parking yet another server thread.
+# A burst of logins is then turned away early and the remaining threads keep
+# serving other routes.
+class PasswordHasher:
+    def __init__(self, n=2 ** 14, r=8, p=1, workers=4, max_queue=16):
+        self.n = n
+        self.r = r
+        self.p = p
+        self.max_pending = workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hasher')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        # Verified against when a username does not exist, so both cases cost the same
+        self._dummy_hash = hash_password('dummy password', n, r, p)
+
+    def _run(self, function, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordHasherBusy()
+            self._pending += 1
+        try:
+            return self._executor.submit(function, *args).result()
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.n, self.r, self.p)
+
+    def verify(self, password, stored):
+        if not stored:
+            self._run(verify_password, password, self._dummy_hash)
+            return False
+        return self._run(verify_password, password, stored)
+
+    def stats(self):
+        with self._lock:
+            return {'pending': self._pending, 'max_pending': self.max_pending, 'rejected': self.rejected}
+
+    def needs_rehash(self, stored):
+        return needs_rehash(stored, self.n, self.r, self.p)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
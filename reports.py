@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+# Rollup rows with this category hold the totals across all categories
+ALL_CATEGORIES = ''
+UNCATEGORIZED = 'Uncategorized'
+SALES_GRANULARITIES = ('hour', 'day', 'week', 'month')
+
+# Backend method giving each rollup table's period expression over an order date
+ROLLUP_PERIODS = {
+    'sales_hourly': 'hour_start',
+    'sales_daily': 'day_start',
+}
+
+
+# Add (sign=1) or remove (sign=-1) one order's contribution to the hourly and
+# daily sales rollups. items is a list of (category, quantity, price). Runs in
+# the caller's transaction so the rollups move together with the order.
+def apply_sales_rollup(cursor, backend, order_date, total_amount, items, sign=1):
+    units_total = 0
+    per_category = {}
+    for category, quantity, price in items:
+        units, revenue = per_category.get(category or UNCATEGORIZED, (0, 0))
+        per_category[category or UNCATEGORIZED] = (units + quantity, revenue + quantity * price)
+        units_total += quantity
+
+    # Rows are always written in the same order to keep lock acquisition consistent between checkouts
+    rows = [(ALL_CATEGORIES, sign, sign * units_total, sign * total_amount)]
+    rows += [(category, sign, sign * units, sign * revenue)
+             for category, (units, revenue) in sorted(per_category.items())]
+
+    periods = {
+        'sales_hourly': order_date.replace(minute=0, second=0, microsecond=0),
+        'sales_daily': order_date.date(),
+    }
+    for table, period_start in periods.items():
+        cursor.execute(
+            backend.upsert_increment(table, ['period_start', 'category', 'order_count', 'units_sold', 'revenue'],
+                                     ['order_count', 'units_sold', 'revenue'], len(rows),
+                                     key_columns=['period_start', 'category']),
+            [value for row in rows for value in (period_start,) + row])
+
+
+# (category, quantity, price) for every item of an order, as apply_sales_rollup expects
+def order_rollup_items(cursor, order_id):
+    cursor.execute("""
+        SELECT p.category, oi.quantity, oi.price
+        FROM OrderItems oi
+        JOIN products p ON p.id = oi.product_id
+        WHERE oi.order_id = %s
+    """, (order_id,))
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+# Recompute both rollup tables from Orders and OrderItems, ignoring cancelled orders
+def rebuild_sales_rollups(cursor, backend):
+    for table, period_method in ROLLUP_PERIODS.items():
+        period = getattr(backend, period_method)('o.order_date')
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} (period_start, category, order_count, units_sold, revenue)
+            SELECT {period}, '', COUNT(*), SUM(i.units), SUM(o.total_amount)
+            FROM Orders o
+            JOIN (SELECT order_id, SUM(quantity) AS units FROM OrderItems GROUP BY order_id) i ON i.order_id = o.id
+            WHERE COALESCE(o.status, '') <> 'Cancelled'
+            GROUP BY {period}
+        """)
+        cursor.execute(f"""
+            INSERT INTO {table} (period_start, category, order_count, units_sold, revenue)
+            SELECT {period}, COALESCE(p.category, '{UNCATEGORIZED}'), COUNT(DISTINCT o.id),
+                   SUM(oi.quantity), SUM(oi.quantity * oi.price)
+            FROM Orders o
+            JOIN OrderItems oi ON oi.order_id = o.id
+            JOIN products p ON p.id = oi.product_id
+            WHERE COALESCE(o.status, '') <> 'Cancelled'
+            GROUP BY {period}, COALESCE(p.category, '{UNCATEGORIZED}')
+        """)
+
+
+def _bucket(period_start, granularity):
+    if granularity == 'week':
+        day = period_start.date() if isinstance(period_start, datetime) else period_start
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return period_start.replace(day=1)
+    return period_start
+
+
+# Sales between date_from and date_to (inclusive dates), newest period first.
+# Hourly rows serve the 'hour' granularity; everything else is folded from
+# the daily rollup, so the query touches at most one row per day and category.
+def sales_report_rows(cursor, date_from, date_to, granularity='day', by_category=False):
+    table = 'sales_hourly' if granularity == 'hour' else 'sales_daily'
+    category_condition = "category <> %s" if by_category else "category = %s"
+    cursor.execute(f"""
+        SELECT period_start, category, order_count, units_sold, revenue
+        FROM {table}
+        WHERE period_start >= %s AND period_start < %s AND {category_condition}
+        ORDER BY period_start
+    """, (date_from, date_to + timedelta(days=1), ALL_CATEGORIES))
+
+    buckets = {}
+    for period_start, category, order_count, units_sold, revenue in cursor.fetchall():
+        key = (_bucket(period_start, granularity), category)
+        row = buckets.setdefault(key, {'period': key[0], 'category': category,
+                                       'total_orders': 0, 'units_sold': 0, 'total_sales': 0})
+        row['total_orders'] += order_count
+        row['units_sold'] += units_sold
+        row['total_sales'] += revenue
+
+    # Periods that netted out to nothing (e.g. every order cancelled) are dropped
+    rows = [row for row in buckets.values() if row['total_orders']]
+    rows.sort(key=lambda row: row['category'])
+    rows.sort(key=lambda row: row['period'], reverse=True)
+    return rows
@@ -0,0 +1,1120 @@
+import json
+import random
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from reports import rebuild_sales_rollups, sales_report_rows
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_names):
+        super().__init__(f"Insufficient stock for {', '.join(product_names)}")
+        self.product_names = product_names
+
+
+class InvalidStatusTransition(Exception):
+    def __init__(self, old_status, new_status):
+        super().__init__(f"An order cannot go from {old_status} to {new_status}")
+        self.old_status = old_status
+        self.new_status = new_status
+
+
+# Order status state machine: the statuses each status may move to
+ORDER_TRANSITIONS = {
+    'Pending': ('Processing', 'Cancelled'),
+    'Processing': ('Shipped', 'Cancelled'),
+    'Shipped': ('Delivered',),
+    'Delivered': (),
+    'Cancelled': (),
+}
+
+# Product search sorts map to (column, direction); every sort ends on p.id so
+# (value, id) pairs are unique and can be used as a keyset cursor.
+PRODUCT_SORTS = {
+    'name': ('p.name', 'ASC'),
+    'price_asc': ('p.price', 'ASC'),
+    'price_desc': ('p.price', 'DESC'),
+    'newest': ('p.id', 'DESC'),
+}
+
+USER_PROFILE_FIELDS = ('first_name', 'last_name', 'date_of_birth', 'gender', 'phone_number', 'username', 'email')
+USER_ROLES = ('Admin', 'Pharmacist', 'Customer')
+# Indexed columns the user directory matches a search prefix against
+USER_SEARCH_COLUMNS = ('username', 'email', 'phone_number', 'first_name', 'last_name')
+PRODUCT_FIELDS = ('sku', 'name', 'description', 'price', 'stock_quantity', 'category', 'reorder_level')
+RATINGS = (1, 2, 3, 4, 5)
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+# total split into count near-equal parts, the larger ones first
+def _spread(total, count):
+    return [total // count + (1 if shard < total % count else 0) for shard in range(count)]
+
+
+# Entry point of the data-access layer: one repository per table, sharing a
+# connection provider and the backend that fills in the dialect-specific SQL.
+# Transactions always use connect; plain reads use connect_read when given,
+# which may hand out a replica connection.
+class Database:
+    def __init__(self, connect, get_backend, connect_read=None):
+        self.connect = connect
+        self.connect_read = connect_read or connect
+        self._get_backend = get_backend
+        self.users = UserRepository(self)
+        self.products = ProductRepository(self)
+        self.orders = OrderRepository(self)
+        self.order_items = OrderItemRepository(self)
+        self.stock = StockRepository(self)
+        self.reviews = ReviewRepository(self)
+        self.sales = SalesRepository(self)
+        self.order_events = OrderEventRepository(self)
+
+    @property
+    def backend(self):
+        return self._get_backend()
+
+    @contextmanager
+    def cursor(self, dictionary=True):
+        conn = self.connect_read()
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            conn.close()
+
+    # Everything in the block commits together, or rolls back on any exception
+    @contextmanager
+    def transaction(self, dictionary=True):
+        conn = self.connect()
+        cursor = conn.cursor(dictionary=dictionary)
+        try:
+            self.backend.begin(conn, cursor)
+            yield cursor
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    # Raises DatabaseError when the database cannot be reached
+    def ping(self):
+        with self.cursor(dictionary=False) as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+
+    # Executed cursor for reading a large result a chunk at a time; the caller closes it
+    def stream(self, sql, params=()):
+        cursor = self.connect_read().cursor(buffered=False)
+        cursor.execute(sql, params)
+        return cursor
+
+
+class Repository:
+    def __init__(self, db):
+        self.db = db
+
+
+class UserRepository(Repository):
+    def get(self, user_id):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT * FROM users WHERE id = %s", (user_id,))
+            return cursor.fetchone()
+
+    def find_by_username(self, username):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT * FROM users WHERE username = %s", (username,))
+            return cursor.fetchone()
+
+    # The user matching username plus either email or phone number, for password resets
+    def find_for_reset(self, username, email=None, phone_number=None):
+        with self.db.cursor() as cursor:
+            if email:
+                cursor.execute("SELECT * FROM users WHERE username = %s AND email = %s", (username, email))
+            else:
+                cursor.execute("SELECT * FROM users WHERE username = %s AND phone_number = %s", (username, phone_number))
+            return cursor.fetchone()
+
+    def username_or_email_taken(self, username, email):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT id FROM users WHERE username = %s OR email = %s LIMIT 1", (username, email))
+            return cursor.fetchone() is not None
+
+    # One page of the admin user directory in id order. search is a prefix of
+    # any USER_SEARCH_COLUMNS column (or an exact id); each column is matched
+    # on its own index and the ids are unioned, so no query scans the table.
+    # Returns (users, id of the last one or None on the last page).
+    def directory(self, search=None, role=None, gender=None, page_size=50, after=None):
+        source = "users u"
+        params = []
+        if search:
+            prefix = search.replace('%', '').replace('_', '') + '%'
+            branches = [f"SELECT id FROM users WHERE {column} LIKE %s" for column in USER_SEARCH_COLUMNS]
+            params.extend([prefix] * len(USER_SEARCH_COLUMNS))
+            if search.isdigit():
+                branches.append("SELECT id FROM users WHERE id = %s")
+                params.append(int(search))
+            source = f"({' UNION '.join(branches)}) m JOIN users u ON u.id = m.id"
+
+        conditions = []
+        if role:
+            conditions.append("u.role = %s")
+            params.append(role)
+        if gender:
+            conditions.append("u.gender = %s")
+            params.append(gender)
+        if after:
+            conditions.append("u.id > %s")
+            params.append(after)
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        with self.db.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT u.id, u.first_name, u.last_name, u.date_of_birth, u.gender, u.phone_number, u.username,
+                       u.email, u.role, u.is_active
+                FROM {source}
+                {where}
+                ORDER BY u.id
+                LIMIT %s
+            """, params + [page_size + 1])
+            users = cursor.fetchall()
+
+        if len(users) > page_size:
+            users = users[:page_size]
+            return users, users[-1]['id']
+        return users, None
+
+    def create(self, profile, password_hash, role='Customer'):
+        columns = list(USER_PROFILE_FIELDS) + ['password', 'role']
+        with self.db.transaction() as cursor:
+            cursor.execute(f"INSERT INTO users ({', '.join(columns)}) VALUES ({_placeholders(columns)})",
+                           [profile[field] for field in USER_PROFILE_FIELDS] + [password_hash, role])
+            return cursor.lastrowid
+
+    # profile holds USER_PROFILE_FIELDS, plus role when an admin edits the user
+    def update(self, user_id, profile, password_hash=None):
+        assignments = {field: profile[field] for field in USER_PROFILE_FIELDS + ('role',) if field in profile}
+        if password_hash:
+            assignments['password'] = password_hash
+        with self.db.transaction() as cursor:
+            cursor.execute(f"UPDATE users SET {', '.join(f'{column} = %s' for column in assignments)} WHERE id = %s",
+                           list(assignments.values()) + [user_id])
+
+    def set_password(self, user_id, password_hash):
+        with self.db.transaction() as cursor:
+            cursor.execute("UPDATE users SET password = %s WHERE id = %s", (password_hash, user_id))
+
+    def delete(self, user_id):
+        with self.db.transaction() as cursor:
+            cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
+
+    # Bulk actions run as one locking SELECT and one UPDATE for any number of
+    # users. They return the ids that actually changed, whose sessions the
+    # caller should revoke.
+    def _bulk_update(self, user_ids, column, value):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return []
+        with self.db.transaction() as cursor:
+            cursor.execute(f"""
+                SELECT id FROM users WHERE id IN ({_placeholders(user_ids)}) AND {column} <> %s{self.db.backend.for_update}
+            """, user_ids + [value])
+            changed = [row['id'] for row in cursor.fetchall()]
+            if changed:
+                cursor.execute(f"UPDATE users SET {column} = %s WHERE id IN ({_placeholders(changed)})",
+                               [value] + changed)
+        return changed
+
+    def set_role(self, user_ids, role):
+        return self._bulk_update(user_ids, 'role', role)
+
+    def set_active(self, user_ids, active):
+        return self._bulk_update(user_ids, 'is_active', 1 if active else 0)
+
+
+class ProductRepository(Repository):
+    def get(self, product_id):
+        return self.get_many([product_id]).get(product_id)
+
+    # {id: row} for the given ids, with a single IN (...) query
+    def get_many(self, product_ids):
+        if not product_ids:
+            return {}
+        product_ids = list(product_ids)
+        with self.db.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT p.*, pr.rating_count, pr.rating_sum * 1.0 / pr.rating_count AS average_rating
+                FROM products p
+                LEFT JOIN product_ratings pr ON pr.product_id = p.id
+                WHERE p.id IN ({_placeholders(product_ids)})
+            """, product_ids)
+            return {row['id']: row for row in cursor.fetchall()}
+
+    def categories(self):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT category FROM products WHERE category IS NOT NULL ORDER BY category")
+            return [row['category'] for row in cursor.fetchall()]
+
+    # Review count, average and the number of reviews per star (highest first)
+    def rating_summary(self, product_id):
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT * FROM product_ratings WHERE product_id = %s
+            """, (product_id,))
+            row = cursor.fetchone() or {}
+        count = row.get('rating_count') or 0
+        return {
+            'rating_count': count,
+            'average_rating': row['rating_sum'] / count if count else None,
+            'histogram': [{'rating': rating, 'count': row.get(f'rating_{rating}', 0)} for rating in reversed(RATINGS)],
+        }
+
+    # One page of search results plus one extra row, which tells the caller there is a next page.
+    # words are matched against the full-text index, prefix against the name; after is the
+    # (sort value, id) of the last row of the previous page.
+    def search(self, words=(), prefix=None, category=None, min_price=None, max_price=None, in_stock=False,
+               sort='name', limit=25, after=None):
+        backend = self.db.backend
+        conditions = []
+        params = []
+        if words:
+            condition, condition_params = backend.fulltext_match('p', 'products', 'name_description',
+                                                                 ['name', 'description'], words)
+            conditions.append(condition)
+            params.extend(condition_params)
+        elif prefix:
+            conditions.append("p.name LIKE %s")
+            params.append(prefix.replace('%', '').replace('_', '') + '%')
+        if category:
+            conditions.append("p.category = %s")
+            params.append(category)
+        if min_price is not None:
+            conditions.append("p.price >= %s")
+            params.append(min_price)
+        if max_price is not None:
+            conditions.append("p.price <= %s")
+            params.append(max_price)
+        if in_stock:
+            conditions.append("p.stock_quantity > 0")
+
+        column, direction = PRODUCT_SORTS[sort]
+        comparison = '>' if direction == 'ASC' else '<'
+        if after:
+            if column == 'p.id':
+                conditions.append(f"p.id {comparison} %s")
+                params.append(after[1])
+            else:
+                conditions.append(f"({column} {comparison} %s OR ({column} = %s AND p.id {comparison} %s))")
+                params.extend([after[0], after[0], after[1]])
+
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        order_by = f"{column} {direction}" if column == 'p.id' else f"{column} {direction}, p.id {direction}"
+        with self.db.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT p.*, pr.rating_count, pr.rating_sum * 1.0 / pr.rating_count AS average_rating
+                FROM products p
+                LEFT JOIN product_ratings pr ON pr.product_id = p.id
+                {where}
+                ORDER BY {order_by}
+                LIMIT %s
+            """, params + [limit + 1])
+            return cursor.fetchall()
+
+    def create(self, fields):
+        with self.db.transaction() as cursor:
+            cursor.execute(f"INSERT INTO products ({', '.join(PRODUCT_FIELDS)}) VALUES ({_placeholders(PRODUCT_FIELDS)})",
+                           [fields[field] for field in PRODUCT_FIELDS])
+            return cursor.lastrowid
+
+    # Writes the product columns in fields. stock_quantity, when there, is the
+    # units on hand (see StockRepository.set_on_hand); leave it out to keep
+    # the stock as it is.
+    def update(self, product_id, fields):
+        columns = [field for field in PRODUCT_FIELDS if field in fields and field != 'stock_quantity']
+        with self.db.transaction() as cursor:
+            cursor.execute(f"UPDATE products SET {', '.join(f'{field} = %s' for field in columns)} WHERE id = %s",
+                           [fields[field] for field in columns] + [product_id])
+            if 'stock_quantity' in fields:
+                self.db.stock.set_on_hand(cursor, product_id, fields['stock_quantity'])
+
+    # Upsert one batch of imported rows by SKU in one transaction: one locking
+    # SELECT for the diff, then one multi-row INSERT ... ON DUPLICATE KEY
+    # UPDATE for the rows that are new or differ. An imported stock_quantity
+    # is the units on hand, so it is compared with those and applied with
+    # set_on_hand; the upsert writes the stored stock back. Returns, per row
+    # in order, {'action': 'insert'|'update'|'unchanged', 'id', 'changes':
+    # {column: (old, new)}}. With dry_run the SELECT does not lock and
+    # nothing is written.
+    def import_batch(self, columns, rows, dry_run=False):
+        skus = [row['sku'] for row in rows]
+        with (self.db.cursor() if dry_run else self.db.transaction()) as cursor:
+            cursor.execute(f"SELECT id, {', '.join(columns)} FROM products WHERE sku IN ({_placeholders(skus)})"
+                           f"{'' if dry_run else self.db.backend.for_update}", skus)
+            # SKUs compare case-insensitively, like the unique key
+            existing = {product['sku'].lower(): product for product in cursor.fetchall()}
+            stored_stock = {}
+            if 'stock_quantity' in columns and existing:
+                on_hand = self.db.stock.on_hand([product['id'] for product in existing.values()], cursor)
+                for product in existing.values():
+                    stored_stock[product['id']] = product['stock_quantity']
+                    product['stock_quantity'] = on_hand[product['id']]
+            results, changed = [], []
+            for row in rows:
+                product = existing.get(row['sku'].lower())
+                if product is None:
+                    results.append({'action': 'insert', 'id': None, 'changes': {}})
+                    changed.append(row)
+                    continue
+                changes = {column: (product[column], row[column]) for column in columns
+                           if column != 'sku' and product[column] != row[column]}
+                results.append({'action': 'update' if changes else 'unchanged', 'id': product['id'], 'changes': changes})
+                if changes:
+                    changed.append(dict(row, stock_quantity=stored_stock[product['id']]) if stored_stock else row)
+            if changed and not dry_run:
+                cursor.execute(self.db.backend.upsert('products', columns, ('sku',), len(changed)),
+                               [row[column] for row in changed for column in columns])
+                for row, result in zip(rows, results):
+                    if 'stock_quantity' in result['changes']:
+                        self.db.stock.set_on_hand(cursor, result['id'], row['stock_quantity'])
+        return results
+
+    # Products that appear on an order are kept; returns whether the product was deleted
+    def delete_unreferenced(self, product_id):
+        with self.db.transaction() as cursor:
+            if self.db.order_items.count_for_product(product_id, cursor):
+                return False
+            cursor.execute("DELETE FROM products WHERE id = %s", (product_id,))
+            return True
+
+    # Sales figures are maintained counters on products, so this never touches OrderItems
+    def _inventory_query(self, low_stock, default_reorder_level):
+        low_stock_condition = "WHERE p.stock_quantity <= COALESCE(p.reorder_level, %s)" if low_stock else ""
+        return f"""
+            SELECT
+                p.id,
+                p.name,
+                p.description,
+                p.price,
+                p.stock_quantity,
+                COALESCE(p.reorder_level, %s) as reorder_level,
+                p.units_sold as total_sold,
+                p.revenue
+            FROM products p
+            {low_stock_condition}
+            ORDER BY p.name
+        """, (default_reorder_level,) * (2 if low_stock else 1)
+
+    def inventory(self, low_stock, default_reorder_level):
+        with self.db.cursor() as cursor:
+            cursor.execute(*self._inventory_query(low_stock, default_reorder_level))
+            return cursor.fetchall()
+
+    def inventory_stream(self, low_stock, default_reorder_level):
+        return self.db.stream(*self._inventory_query(low_stock, default_reorder_level))
+
+    # Products whose units_sold/revenue counters (plus the sales still on
+    # their stock shards) disagree with OrderItems; fix=True rewrites them
+    def reconcile_counters(self, fix=False):
+        with self.db.transaction() as cursor:
+            if fix:
+                # Hold off checkouts while the counters are compared and rewritten
+                cursor.execute(f"SELECT id FROM products ORDER BY id{self.db.backend.for_update}")
+                cursor.fetchall()
+                cursor.execute(f"SELECT product_id FROM stock_shards ORDER BY product_id, shard{self.db.backend.for_update}")
+                cursor.fetchall()
+            cursor.execute("""
+                SELECT p.id, p.name,
+                       p.units_sold + COALESCE(h.units, 0) as units_sold, p.revenue + COALESCE(h.revenue, 0) as revenue,
+                       COALESCE(h.units, 0) as shard_units, COALESCE(h.revenue, 0) as shard_revenue,
+                       COALESCE(s.units, 0) as expected_units, COALESCE(s.revenue, 0) as expected_revenue
+                FROM products p
+                LEFT JOIN (
+                    SELECT product_id, SUM(quantity) as units, SUM(quantity * price) as revenue
+                    FROM OrderItems GROUP BY product_id
+                ) s ON s.product_id = p.id
+                LEFT JOIN (
+                    SELECT product_id, SUM(units_sold) as units, SUM(revenue) as revenue
+                    FROM stock_shards GROUP BY product_id
+                ) h ON h.product_id = p.id
+                WHERE p.units_sold + COALESCE(h.units, 0) <> COALESCE(s.units, 0)
+                   OR ROUND(p.revenue + COALESCE(h.revenue, 0), 2) <> ROUND(COALESCE(s.revenue, 0), 2)
+            """)
+            drifted = cursor.fetchall()
+            if fix and drifted:
+                cursor.executemany("UPDATE products SET units_sold = %s, revenue = %s WHERE id = %s",
+                                   [(row['expected_units'] - row['shard_units'], row['expected_revenue'] - row['shard_revenue'],
+                                     row['id']) for row in drifted])
+            return drifted
+
+
+class OrderRepository(Repository):
+    # One page of orders, newest first, using keyset pagination on (order_date, id).
+    # filters holds status, date_from, date_to and after (order_date, id).
+    def page(self, filters, customer_id=None, page_size=20):
+        conditions = []
+        params = []
+        if customer_id is not None:
+            conditions.append("customer_id = %s")
+            params.append(customer_id)
+        if filters['status']:
+            conditions.append("status = %s")
+            params.append(filters['status'])
+        if filters['date_from']:
+            conditions.append("order_date >= %s")
+            params.append(filters['date_from'])
+        if filters['date_to']:
+            conditions.append("order_date < %s")
+            params.append(filters['date_to'] + timedelta(days=1))
+        if filters['after']:
+            conditions.append("(order_date < %s OR (order_date = %s AND id < %s))")
+            params.extend([filters['after'][0], filters['after'][0], filters['after'][1]])
+
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        with self.db.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT * FROM Orders
+                {where}
+                ORDER BY order_date DESC, id DESC
+                LIMIT %s
+            """, params + [page_size + 1])
+            orders = cursor.fetchall()
+
+            next_cursor = None
+            if len(orders) > page_size:
+                orders = orders[:page_size]
+                last = orders[-1]
+                next_cursor = (last['order_date'], last['id'])
+
+            items = self.db.order_items.for_orders([order['id'] for order in orders], cursor)
+        for order in orders:
+            order['items'] = items.get(order['id'], [])
+        return orders, next_cursor
+
+    # Create an order for {product_id: quantity} lines in one transaction. All
+    # lines are priced with one query, the stock of ordinary products is taken
+    # with one conditional UPDATE and the items go in with one INSERT, so the
+    # number of statements does not depend on the size of the cart; split
+    # products (see StockRepository) take one more UPDATE each, on a shard.
+    # Units the customer holds from adding them to the cart are already off
+    # the stock and only change hands. Everything else (rollups, alerts,
+    # receipts) follows from the order_created event, which records each
+    # line's stock [before, after] the order. Raises InsufficientStock
+    # (after rolling back) if any line is short.
+    def place(self, customer_id, lines):
+        lines = {product_id: quantity for product_id, quantity in lines.items() if quantity > 0}
+        if not lines:
+            raise ValueError('An order needs at least one line')
+        product_ids = sorted(lines)
+
+        with self.db.transaction() as cursor:
+            # Not locked: every stock change below is guarded in its UPDATE, and
+            # a hot product's row must not become the one lock all checkouts wait on
+            products = self.db.stock.products(cursor, product_ids)
+            held = self.db.stock.consume(cursor, customer_id, product_ids)
+            needed = {product_id: max(lines[product_id] - held.get(product_id, 0), 0) for product_id in product_ids}
+            short = [products[product_id]['name'] if product_id in products else f'product #{product_id}'
+                     for product_id in product_ids
+                     if product_id not in products
+                     or not products[product_id]['stock_shards'] and products[product_id]['stock_quantity'] < needed[product_id]]
+            if short:
+                raise InsufficientStock(short)
+
+            # The same statement moves the per-product sales counters, so they
+            # never drift from the stock they were taken from
+            unsplit = [product_id for product_id in product_ids if not products[product_id]['stock_shards']]
+            if unsplit:
+                case_sql = " ".join(["WHEN %s THEN %s"] * len(unsplit))
+                needed_params = [value for product_id in unsplit for value in (product_id, needed[product_id])]
+                quantity_params = [value for product_id in unsplit for value in (product_id, lines[product_id])]
+                revenue_params = [value for product_id in unsplit
+                                  for value in (product_id, lines[product_id] * products[product_id]['price'])]
+                cursor.execute(f"""
+                    UPDATE products
+                    SET stock_quantity = stock_quantity - CASE id {case_sql} END,
+                        units_sold = units_sold + CASE id {case_sql} END,
+                        revenue = revenue + CASE id {case_sql} END
+                    WHERE id IN ({_placeholders(unsplit)}) AND stock_shards = 0 AND stock_quantity >= CASE id {case_sql} END
+                """, needed_params + quantity_params + revenue_params + unsplit + needed_params)
+                if cursor.rowcount != len(unsplit):
+                    raise InsufficientStock([products[product_id]['name'] for product_id in unsplit])
+            for product_id in product_ids:
+                product = products[product_id]
+                if product['stock_shards']:
+                    self.db.stock.take(cursor, product, needed[product_id], lines[product_id],
+                                       lines[product_id] * product['price'])
+                if held.get(product_id, 0) > lines[product_id]:
+                    self.db.stock.give_back(cursor, product, held[product_id] - lines[product_id])
+
+            total_amount = sum(products[product_id]['price'] * lines[product_id] for product_id in product_ids)
+            order_date = datetime.now().replace(microsecond=0)
+            cursor.execute("INSERT INTO Orders (customer_id, order_date, total_amount) VALUES (%s, %s, %s)",
+                           (customer_id, order_date, total_amount))
+            order_id = cursor.lastrowid
+
+            self.db.order_items.insert(cursor, order_id, [(product_id, lines[product_id], products[product_id]['price'])
+                                                          for product_id in product_ids])
+            # The stock each line left behind, for the low-stock alerts: read
+            # here, not when the event is handled, when later orders may have
+            # moved it again. Held units count as taken by the order that buys them.
+            available = self.db.stock.available(cursor, product_ids)
+            stock = {str(product_id): [available[product_id] + lines[product_id], available[product_id]]
+                     for product_id in product_ids}
+            self.db.order_events.record(cursor, order_id, 'order_created', {'customer_id': customer_id, 'stock': stock})
+        return order_id
+
+    # Move an order along ORDER_TRANSITIONS and emit order_status_changed in
+    # the same transaction. Returns the previous status, or None if there is
+    # no such order; raises InvalidStatusTransition for a move the state
+    # machine does not allow.
+    def update_status(self, order_id, new_status):
+        with self.db.transaction() as cursor:
+            cursor.execute(f"SELECT status FROM Orders WHERE id = %s{self.db.backend.for_update}", (order_id,))
+            order = cursor.fetchone()
+            if order is None:
+                return None
+            old_status = order['status'] or 'Pending'
+            if new_status == old_status:
+                return old_status
+            if new_status not in ORDER_TRANSITIONS.get(old_status, ()):
+                raise InvalidStatusTransition(old_status, new_status)
+            cursor.execute("UPDATE Orders SET status = %s WHERE id = %s", (new_status, order_id))
+            self.db.order_events.record(cursor, order_id, 'order_status_changed', {'from': old_status, 'to': new_status})
+            return old_status
+
+    # One row per order item, oldest order first, for the streaming export
+    def export_stream(self, filters):
+        conditions = []
+        params = []
+        if filters['status']:
+            conditions.append("o.status = %s")
+            params.append(filters['status'])
+        if filters['date_from']:
+            conditions.append("o.order_date >= %s")
+            params.append(filters['date_from'])
+        if filters['date_to']:
+            conditions.append("o.order_date < %s")
+            params.append(filters['date_to'] + timedelta(days=1))
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        return self.db.stream(f"""
+            SELECT o.id as order_id, o.order_date, o.status, o.customer_id, u.username,
+                   oi.product_id, p.name as product_name, p.category, oi.quantity, oi.price
+            FROM Orders o
+            JOIN OrderItems oi ON oi.order_id = o.id
+            JOIN products p ON p.id = oi.product_id
+            LEFT JOIN users u ON u.id = o.customer_id
+            {where}
+            ORDER BY o.order_date, o.id, oi.id
+        """, params)
+
+
+class OrderItemRepository(Repository):
+    # {order_id: [item, ...]} for every given order, with a single query
+    def for_orders(self, order_ids, cursor):
+        if not order_ids:
+            return {}
+        cursor.execute(f"""
+            SELECT oi.order_id, p.id as product_id, p.name, p.description, p.category, oi.quantity, oi.price
+            FROM OrderItems oi
+            JOIN products p ON oi.product_id = p.id
+            WHERE oi.order_id IN ({_placeholders(order_ids)})
+            ORDER BY oi.order_id, oi.id
+        """, list(order_ids))
+        items = {}
+        for item in cursor.fetchall():
+            items.setdefault(item['order_id'], []).append(item)
+        return items
+
+    # rows are (product_id, quantity, price), written with one multi-row INSERT
+    def insert(self, cursor, order_id, rows):
+        cursor.execute(
+            "INSERT INTO OrderItems (order_id, product_id, quantity, price) VALUES "
+            + ", ".join(["(%s, %s, %s, %s)"] * len(rows)),
+            [value for row in rows for value in (order_id,) + tuple(row)])
+
+    def count_for_product(self, product_id, cursor):
+        cursor.execute("SELECT COUNT(*) AS count FROM OrderItems WHERE product_id = %s", (product_id,))
+        row = cursor.fetchone()
+        return row['count'] if isinstance(row, dict) else row[0]
+
+
+# Stock reservations and split stock. Adding to the cart holds the units:
+# they come off the stock straight away and go back when the hold expires,
+# unless a checkout takes them first. A hot product can be split: its stock
+# is spread over products.stock_shards rows of stock_shards, and each
+# checkout takes its units (and adds its sales) on one shard picked at
+# random, so concurrent checkouts of the same product lock different rows.
+# The products row of a split product is brought up to date by fold(), which
+# the sweeper runs every few seconds.
+class StockRepository(Repository):
+    # {id: row} with what taking stock needs, read in the caller's transaction
+    def products(self, cursor, product_ids):
+        cursor.execute(f"""
+            SELECT id, name, price, stock_quantity, category, stock_shards
+            FROM products WHERE id IN ({_placeholders(product_ids)})
+        """, list(product_ids))
+        return {row['id']: row for row in cursor.fetchall()}
+
+    # Take quantity units of a product and add units/revenue to its sales.
+    # Raises InsufficientStock if the stock cannot cover it.
+    def take(self, cursor, product, quantity, units=0, revenue=0):
+        if product['stock_shards']:
+            cursor.execute("SELECT shard, stock_quantity FROM stock_shards WHERE product_id = %s", (product['id'],))
+            shards = cursor.fetchall()
+            if shards:
+                candidates = [row['shard'] for row in shards if row['stock_quantity'] >= quantity]
+                if candidates:
+                    cursor.execute("""
+                        UPDATE stock_shards
+                        SET stock_quantity = stock_quantity - %s, units_sold = units_sold + %s, revenue = revenue + %s
+                        WHERE product_id = %s AND shard = %s AND stock_quantity >= %s
+                    """, (quantity, units, revenue, product['id'], random.choice(candidates), quantity))
+                    if cursor.rowcount == 1:
+                        return
+                return self._take_across_shards(cursor, product, quantity, units, revenue)
+        cursor.execute("""
+            UPDATE products
+            SET stock_quantity = stock_quantity - %s, units_sold = units_sold + %s, revenue = revenue + %s
+            WHERE id = %s AND stock_shards = 0 AND stock_quantity >= %s
+        """, (quantity, units, revenue, product['id'], quantity))
+        if cursor.rowcount != 1:
+            raise InsufficientStock([product['name']])
+
+    # No single shard holds enough: lock them all, in order, and take from as
+    # many as it needs. Only happens as a split product runs low.
+    def _take_across_shards(self, cursor, product, quantity, units, revenue):
+        cursor.execute(f"SELECT shard, stock_quantity FROM stock_shards WHERE product_id = %s ORDER BY shard"
+                       f"{self.db.backend.for_update}", (product['id'],))
+        shards = cursor.fetchall()
+        if not shards or sum(row['stock_quantity'] for row in shards) < quantity:
+            raise InsufficientStock([product['name']])
+        taken, remaining = [], quantity
+        for row in shards:
+            amount = min(row['stock_quantity'], remaining)
+            if amount:
+                taken.append((row['shard'], amount))
+                remaining -= amount
+        first = shards[0]['shard']
+        taken = taken or [(first, 0)]
+        cursor.execute(f"""
+            UPDATE stock_shards
+            SET stock_quantity = stock_quantity - CASE shard {" ".join(["WHEN %s THEN %s"] * len(taken))} ELSE 0 END,
+                units_sold = units_sold + CASE shard WHEN %s THEN %s ELSE 0 END,
+                revenue = revenue + CASE shard WHEN %s THEN %s ELSE 0 END
+            WHERE product_id = %s
+        """, [value for pair in taken for value in pair] + [first, units, first, revenue, product['id']])
+
+    # {id: units available}, a split product's being the total of its shards.
+    # Read in the caller's transaction, it includes the caller's own changes.
+    def available(self, cursor, product_ids):
+        placeholders = _placeholders(product_ids)
+        cursor.execute(f"""
+            SELECT p.id, COALESCE(s.stock, p.stock_quantity) AS stock
+            FROM products p
+            LEFT JOIN (
+                SELECT product_id, SUM(stock_quantity) AS stock FROM stock_shards
+                WHERE product_id IN ({placeholders}) GROUP BY product_id
+            ) s ON s.product_id = p.id
+            WHERE p.id IN ({placeholders})
+        """, list(product_ids) * 2)
+        return {row['id']: int(row['stock']) for row in cursor.fetchall()}
+
+    # {id: units on hand}: the stock still available (live from the shards of
+    # a split product) plus the units held in carts
+    def on_hand(self, product_ids, cursor=None):
+        if cursor is None:
+            with self.db.cursor() as cursor:
+                return self.on_hand(product_ids, cursor)
+        placeholders = _placeholders(product_ids)
+        cursor.execute(f"""
+            SELECT p.id, COALESCE(s.stock, p.stock_quantity) + COALESCE(h.held, 0) AS on_hand
+            FROM products p
+            LEFT JOIN (
+                SELECT product_id, SUM(stock_quantity) AS stock FROM stock_shards
+                WHERE product_id IN ({placeholders}) GROUP BY product_id
+            ) s ON s.product_id = p.id
+            LEFT JOIN (
+                SELECT product_id, SUM(quantity) AS held FROM stock_reservations
+                WHERE product_id IN ({placeholders}) GROUP BY product_id
+            ) h ON h.product_id = p.id
+            WHERE p.id IN ({placeholders})
+        """, list(product_ids) * 3)
+        return {row['id']: int(row['on_hand']) for row in cursor.fetchall()}
+
+    # Replace a product's stock with a count of the units on hand, the held
+    # ones included: what stays available is on_hand less the holds. Holds
+    # the count cannot cover are cut back, newest first, so that expiring
+    # them cannot give back units that are not there. Runs in the caller's
+    # transaction and locks the holds before the stock, like checkouts do.
+    def set_on_hand(self, cursor, product_id, on_hand):
+        cursor.execute(f"""
+            SELECT id, quantity FROM stock_reservations
+            WHERE product_id = %s ORDER BY expires_at DESC, id DESC{self.db.backend.for_update}
+        """, (product_id,))
+        holds = cursor.fetchall()
+        held = sum(hold['quantity'] for hold in holds)
+        for hold in holds:
+            if held <= max(on_hand, 0):
+                break
+            cut = min(hold['quantity'], held - max(on_hand, 0))
+            if cut == hold['quantity']:
+                cursor.execute("DELETE FROM stock_reservations WHERE id = %s", (hold['id'],))
+            else:
+                cursor.execute("UPDATE stock_reservations SET quantity = quantity - %s WHERE id = %s", (cut, hold['id']))
+            held -= cut
+        cursor.execute(f"SELECT stock_shards FROM products WHERE id = %s{self.db.backend.for_update}", (product_id,))
+        product = cursor.fetchone()
+        if product is None:
+            return
+        if product['stock_shards']:
+            self.rebalance(cursor, product_id, on_hand - held)
+        else:
+            cursor.execute("UPDATE products SET stock_quantity = %s WHERE id = %s", (on_hand - held, product_id))
+
+    # Put units back wherever the product keeps its stock now
+    def give_back(self, cursor, product, quantity):
+        if product['stock_shards']:
+            cursor.execute("UPDATE stock_shards SET stock_quantity = stock_quantity + %s WHERE product_id = %s AND shard = %s",
+                           (quantity, product['id'], random.randrange(product['stock_shards'])))
+            if cursor.rowcount == 1:
+                return
+        cursor.execute("UPDATE products SET stock_quantity = stock_quantity + %s WHERE id = %s AND stock_shards = 0",
+                       (quantity, product['id']))
+        if cursor.rowcount == 0:
+            # Split since the caller read it
+            cursor.execute("UPDATE stock_shards SET stock_quantity = stock_quantity + %s WHERE product_id = %s AND shard = 0",
+                           (quantity, product['id']))
+
+    # Hold quantity units of a product for a user for ttl seconds, in place
+    # of any hold they already have on it (0 releases it). Raises
+    # InsufficientStock when the stock cannot cover the increase.
+    def hold(self, user_id, product_id, quantity, ttl):
+        with self.db.transaction() as cursor:
+            cursor.execute(f"""
+                SELECT id, quantity FROM stock_reservations WHERE user_id = %s AND product_id = %s{self.db.backend.for_update}
+            """, (user_id, product_id))
+            hold = cursor.fetchone()
+            held = hold['quantity'] if hold else 0
+            product = self.products(cursor, [product_id]).get(product_id)
+            if product is None:
+                raise InsufficientStock([f'product #{product_id}'])
+            if quantity > held:
+                self.take(cursor, product, quantity - held)
+            elif quantity < held:
+                self.give_back(cursor, product, held - quantity)
+
+            expires_at = datetime.now().replace(microsecond=0) + timedelta(seconds=ttl)
+            if quantity == 0:
+                if hold:
+                    cursor.execute("DELETE FROM stock_reservations WHERE id = %s", (hold['id'],))
+            elif hold:
+                cursor.execute("UPDATE stock_reservations SET quantity = %s, expires_at = %s WHERE id = %s",
+                               (quantity, expires_at, hold['id']))
+            else:
+                cursor.execute("INSERT INTO stock_reservations (user_id, product_id, quantity, expires_at) VALUES (%s, %s, %s, %s)",
+                               (user_id, product_id, quantity, expires_at))
+
+    # Remove a user's holds on the given products inside the caller's
+    # transaction (a checkout), returning {product_id: quantity} held
+    def consume(self, cursor, user_id, product_ids):
+        cursor.execute(f"""
+            SELECT id, product_id, quantity FROM stock_reservations
+            WHERE user_id = %s AND product_id IN ({_placeholders(product_ids)}){self.db.backend.for_update}
+        """, [user_id] + list(product_ids))
+        holds = cursor.fetchall()
+        if holds:
+            cursor.execute(f"DELETE FROM stock_reservations WHERE id IN ({_placeholders(holds)})", [hold['id'] for hold in holds])
+        return {hold['product_id']: hold['quantity'] for hold in holds}
+
+    # Give the stock of up to limit expired holds back; returns {product_id: units}
+    def expire(self, limit=500):
+        now = datetime.now().replace(microsecond=0)
+        with self.db.transaction() as cursor:
+            cursor.execute(f"""
+                SELECT id, product_id, quantity FROM stock_reservations
+                WHERE expires_at <= %s
+                ORDER BY expires_at, id
+                LIMIT %s{self.db.backend.for_update}
+            """, (now, limit))
+            holds = cursor.fetchall()
+            if not holds:
+                return {}
+            quantities = Counter()
+            for hold in holds:
+                quantities[hold['product_id']] += hold['quantity']
+            products = self.products(cursor, list(quantities))
+            for product_id, quantity in quantities.items():
+                if product_id in products:
+                    self.give_back(cursor, products[product_id], quantity)
+            cursor.execute(f"DELETE FROM stock_reservations WHERE id IN ({_placeholders(holds)})", [hold['id'] for hold in holds])
+        return dict(quantities)
+
+    # Move a split product's shard sales onto its products row, set its
+    # stock_quantity to the shards' total (or to total, replacing the stock)
+    # and even the stock out across the shards. Returns whether the products
+    # row changed; does nothing for a product that is not split.
+    def rebalance(self, cursor, product_id, total=None):
+        cursor.execute(f"SELECT stock_quantity, stock_shards FROM products WHERE id = %s{self.db.backend.for_update}",
+                       (product_id,))
+        product = cursor.fetchone()
+        if product is None or not product['stock_shards']:
+            return False
+        cursor.execute(f"""
+            SELECT shard, stock_quantity, units_sold, revenue FROM stock_shards
+            WHERE product_id = %s ORDER BY shard{self.db.backend.for_update}
+        """, (product_id,))
+        shards = cursor.fetchall()
+        if not shards:
+            return False
+        stock = [row['stock_quantity'] for row in shards]
+        units = sum(row['units_sold'] for row in shards)
+        revenue = sum(row['revenue'] for row in shards)
+        if total is None:
+            total = sum(stock)
+        spread = _spread(total, len(shards))
+        if spread != stock or units or revenue:
+            case_sql = " ".join(["WHEN %s THEN %s"] * len(shards))
+            cursor.execute(f"""
+                UPDATE stock_shards SET stock_quantity = CASE shard {case_sql} END, units_sold = 0, revenue = 0
+                WHERE product_id = %s
+            """, [value for row, quantity in zip(shards, spread) for value in (row['shard'], quantity)] + [product_id])
+        if total == product['stock_quantity'] and not units and not revenue:
+            return False
+        cursor.execute("UPDATE products SET stock_quantity = %s, units_sold = units_sold + %s, revenue = revenue + %s WHERE id = %s",
+                       (total, units, revenue, product_id))
+        return True
+
+    # Rebalance every split product, each in its own short transaction;
+    # returns the ids whose products row changed
+    def fold(self):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT id FROM products WHERE stock_shards > 0")
+            product_ids = [row['id'] for row in cursor.fetchall()]
+        changed = []
+        for product_id in product_ids:
+            with self.db.transaction() as cursor:
+                if self.rebalance(cursor, product_id):
+                    changed.append(product_id)
+        return changed
+
+    # Spread a product's stock over shards rows, or with 0 put it back on the
+    # products row. Returns the stock, or None if there is no such product.
+    def split(self, product_id, shards):
+        with self.db.transaction() as cursor:
+            self.rebalance(cursor, product_id)
+            cursor.execute(f"SELECT stock_quantity FROM products WHERE id = %s{self.db.backend.for_update}", (product_id,))
+            product = cursor.fetchone()
+            if product is None:
+                return None
+            cursor.execute("DELETE FROM stock_shards WHERE product_id = %s", (product_id,))
+            if shards:
+                cursor.execute("INSERT INTO stock_shards (product_id, shard, stock_quantity) VALUES "
+                               + ", ".join(["(%s, %s, %s)"] * shards),
+                               [value for shard, quantity in enumerate(_spread(product['stock_quantity'], shards))
+                                for value in (product_id, shard, quantity)])
+            cursor.execute("UPDATE products SET stock_shards = %s WHERE id = %s", (shards, product_id))
+            return product['stock_quantity']
+
+    # Outstanding holds and the state of every split product
+    def stats(self):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) AS holds, COALESCE(SUM(quantity), 0) AS units, MIN(expires_at) AS next_expiry "
+                           "FROM stock_reservations")
+            holds = cursor.fetchone()
+            cursor.execute("""
+                SELECT p.id, p.name, p.stock_shards, p.stock_quantity,
+                       SUM(s.stock_quantity) AS shard_stock, SUM(s.units_sold) AS unfolded_units
+                FROM products p
+                JOIN stock_shards s ON s.product_id = p.id
+                GROUP BY p.id, p.name, p.stock_shards, p.stock_quantity
+                ORDER BY p.id
+            """)
+            split = cursor.fetchall()
+        for row in split:
+            row['shard_stock'] = int(row['shard_stock'])
+            row['unfolded_units'] = int(row['unfolded_units'])
+        return {'holds': holds['holds'], 'held_units': int(holds['units']), 'next_expiry': holds['next_expiry'],
+                'split_products': split}
+
+
+class ReviewRepository(Repository):
+    # Newest reviews first, one page at a time off the (product_id, created_at, id)
+    # key. Returns (reviews, (created_at, id) of the last one or None on the last page).
+    def page(self, product_id, page_size=20, after=None):
+        conditions = ["r.product_id = %s"]
+        params = [product_id]
+        if after:
+            conditions.append("(r.created_at < %s OR (r.created_at = %s AND r.id < %s))")
+            params.extend([after[0], after[0], after[1]])
+        with self.db.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT r.id, r.rating, r.review, r.created_at, u.username
+                FROM reviews r
+                JOIN users u ON r.user_id = u.id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY r.created_at DESC, r.id DESC
+                LIMIT %s
+            """, params + [page_size + 1])
+            reviews = cursor.fetchall()
+
+        if len(reviews) > page_size:
+            reviews = reviews[:page_size]
+            return reviews, (reviews[-1]['created_at'], reviews[-1]['id'])
+        return reviews, None
+
+    def for_user(self, user_id, product_id):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT * FROM reviews WHERE user_id = %s AND product_id = %s", (user_id, product_id))
+            return cursor.fetchone()
+
+    # A user has one review per product: a second submission replaces the
+    # first and moves to the top. The rating summary and histogram move in
+    # the same transaction. Returns True if an earlier review was replaced.
+    def save(self, user_id, product_id, rating, review):
+        now = datetime.now().replace(microsecond=0)
+        with self.db.transaction() as cursor:
+            cursor.execute(f"""
+                SELECT id, rating FROM reviews WHERE user_id = %s AND product_id = %s{self.db.backend.for_update}
+            """, (user_id, product_id))
+            existing = cursor.fetchone()
+            if existing:
+                cursor.execute("""
+                    UPDATE reviews SET rating = %s, review = %s, created_at = %s WHERE id = %s
+                """, (rating, review, now, existing['id']))
+                increments = {'rating_count': 0, 'rating_sum': rating - existing['rating']}
+                if existing['rating'] != rating:
+                    increments[f"rating_{existing['rating']}"] = -1
+                    increments[f'rating_{rating}'] = 1
+            else:
+                cursor.execute("""
+                    INSERT INTO reviews (user_id, product_id, rating, review, created_at)
+                    VALUES (%s, %s, %s, %s, %s)
+                """, (user_id, product_id, rating, review, now))
+                increments = {'rating_count': 1, 'rating_sum': rating, f'rating_{rating}': 1}
+            cursor.execute(self.db.backend.upsert_increment('product_ratings', ['product_id'] + list(increments),
+                                                            list(increments), key_columns=['product_id']),
+                           [product_id] + list(increments.values()))
+        return existing is not None
+
+    # Recompute product_ratings from the reviews table; returns the number of products with reviews
+    def rebuild_ratings(self):
+        histogram = ", ".join(f"SUM(CASE WHEN rating = {rating} THEN 1 ELSE 0 END)" for rating in RATINGS)
+        with self.db.transaction() as cursor:
+            cursor.execute("DELETE FROM product_ratings")
+            cursor.execute(f"""
+                INSERT INTO product_ratings (product_id, rating_count, rating_sum, {', '.join(f'rating_{rating}' for rating in RATINGS)})
+                SELECT product_id, COUNT(*), SUM(rating), {histogram} FROM reviews GROUP BY product_id
+            """)
+            return cursor.rowcount
+
+
+class SalesRepository(Repository):
+    def report(self, date_from, date_to, granularity='day', by_category=False):
+        with self.db.cursor(dictionary=False) as cursor:
+            return sales_report_rows(cursor, date_from, date_to, granularity, by_category)
+
+    # The rebuilt rollups already count every order, so rollup work still
+    # waiting in the outbox is marked done in the same transaction
+    def rebuild_rollups(self):
+        with self.db.transaction(dictionary=False) as cursor:
+            rebuild_sales_rollups(cursor, self.db.backend)
+            cursor.execute("""
+                INSERT INTO order_event_handlers (event_id, handler, processed_at)
+                SELECT e.id, 'sales_rollup', %s FROM order_events e
+                WHERE e.status <> 'done'
+                  AND NOT EXISTS (SELECT 1 FROM order_event_handlers h WHERE h.event_id = e.id AND h.handler = 'sales_rollup')
+            """, (datetime.now().replace(microsecond=0),))
+
+
+# Transactional outbox. Events are written in the same transaction as the
+# change they describe and consumed by outbox.OutboxWorker.
+class OrderEventRepository(Repository):
+    def record(self, cursor, order_id, event_type, payload=None):
+        now = datetime.now().replace(microsecond=0)
+        cursor.execute("""
+            INSERT INTO order_events (order_id, event_type, payload, created_at, available_at)
+            VALUES (%s, %s, %s, %s, %s)
+        """, (order_id, event_type, json.dumps(payload or {}), now, now))
+
+    # Lease up to limit due events to one worker. A lease that runs out
+    # (the worker died mid-batch) makes its events claimable again.
+    def claim(self, worker_id, limit, lease_seconds):
+        now = datetime.now().replace(microsecond=0)
+        with self.db.transaction() as cursor:
+            cursor.execute(f"""
+                SELECT id FROM order_events
+                WHERE status = 'pending' AND available_at <= %s AND (locked_until IS NULL OR locked_until < %s)
+                ORDER BY id
+                LIMIT %s{self.db.backend.for_update}
+            """, (now, now, limit))
+            ids = [row['id'] for row in cursor.fetchall()]
+            if not ids:
+                return []
+            cursor.execute(f"UPDATE order_events SET locked_by = %s, locked_until = %s WHERE id IN ({_placeholders(ids)})",
+                           [worker_id, now + timedelta(seconds=lease_seconds)] + ids)
+            cursor.execute(f"SELECT * FROM order_events WHERE id IN ({_placeholders(ids)}) ORDER BY id", ids)
+            events = cursor.fetchall()
+        for event in events:
+            event['payload'] = json.loads(event['payload'])
+        return events
+
+    def handled(self, event_id):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT handler FROM order_event_handlers WHERE event_id = %s", (event_id,))
+            return {row['handler'] for row in cursor.fetchall()}
+
+    # Written in the handler's own transaction, so a handler's database work happens exactly once
+    def mark_handled(self, cursor, event_id, handler):
+        cursor.execute("INSERT INTO order_event_handlers (event_id, handler, processed_at) VALUES (%s, %s, %s)",
+                       (event_id, handler, datetime.now().replace(microsecond=0)))
+
+    def complete(self, event_id, worker_id):
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                UPDATE order_events SET status = 'done', processed_at = %s, locked_by = NULL, locked_until = NULL
+                WHERE id = %s AND locked_by = %s
+            """, (datetime.now().replace(microsecond=0), event_id, worker_id))
+
+    # Schedule a retry after retry_delay seconds, or park the event as failed
+    # once it has used up max_attempts. Returns whether it was parked.
+    def fail(self, event, worker_id, error, max_attempts, retry_delay):
+        attempts = event['attempts'] + 1
+        status = 'failed' if attempts >= max_attempts else 'pending'
+        with self.db.transaction() as cursor:
+            cursor.execute("""
+                UPDATE order_events
+                SET status = %s, attempts = %s, available_at = %s, last_error = %s, locked_by = NULL, locked_until = NULL
+                WHERE id = %s AND locked_by = %s
+            """, (status, attempts, datetime.now().replace(microsecond=0) + timedelta(seconds=retry_delay),
+                  error[:2000], event['id'], worker_id))
+        return status == 'failed'
+
+    def requeue_failed(self):
+        with self.db.transaction() as cursor:
+            cursor.execute("UPDATE order_events SET status = 'pending', attempts = 0, available_at = %s WHERE status = 'failed'",
+                           (datetime.now().replace(microsecond=0),))
+            return cursor.rowcount
+
+    # Handled events older than the cutoff; their handler markers go with them
+    def purge_done(self, before):
+        with self.db.transaction() as cursor:
+            cursor.execute("DELETE FROM order_events WHERE status = 'done' AND processed_at < %s", (before,))
+            return cursor.rowcount
+
+    # Backlog, parked failures and lag (age of the oldest pending event)
+    def stats(self):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT status, COUNT(*) AS count FROM order_events GROUP BY status")
+            counts = {row['status']: row['count'] for row in cursor.fetchall()}
+            cursor.execute("SELECT created_at FROM order_events WHERE status = 'pending' ORDER BY id LIMIT 1")
+            oldest = cursor.fetchone()
+        return {
+            'pending': counts.get('pending', 0),
+            'failed': counts.get('failed', 0),
+            'done': counts.get('done', 0),
+            'lag_seconds': max((datetime.now() - oldest['created_at']).total_seconds(), 0) if oldest else 0,
+        }
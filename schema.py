@@ -0,0 +1,156 @@
+import os
+import re
+
+# database.sql is the one definition of the schema. MySQL runs it as is; for
+# SQLite the phpMyAdmin-style dump (CREATE TABLE, then ALTER TABLE for keys,
+# AUTO_INCREMENT and constraints) is folded into self-contained CREATE TABLE
+# statements, indexes and FTS5 tables standing in for FULLTEXT keys.
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database.sql')
+
+_COLUMN = re.compile(r'^`(\w+)`\s+(\w+(?:\([^)]*\))?)(?:\s+unsigned)?\s*(.*)$', re.I | re.S)
+_KEY = re.compile(r'^ADD\s+(PRIMARY\s+KEY|UNIQUE\s+KEY|FULLTEXT\s+KEY|KEY)\s*(?:`(\w+)`\s*)?\((.*)\)$', re.I | re.S)
+_FOREIGN_KEY = re.compile(r'^ADD\s+CONSTRAINT\s+`\w+`\s+FOREIGN\s+KEY\s*\((.*?)\)\s*REFERENCES\s+`(\w+)`\s*\((.*?)\)(.*)$',
+                          re.I | re.S)
+_MODIFY = re.compile(r'^MODIFY\s+`(\w+)`.*\bAUTO_INCREMENT\b', re.I | re.S)
+
+
+class Table:
+    def __init__(self, name):
+        self.name = name
+        self.columns = []  # (name, type, rest of the definition)
+        self.primary_key = []
+        self.autoincrement = None
+        self.indexes = []  # (name, columns, unique)
+        self.fulltext = []  # (name, columns)
+        self.foreign_keys = []  # (columns, ref_table, ref_columns, actions)
+
+    def fulltext_table(self, index):
+        return f'{self.name}_{index}'
+
+
+def _identifiers(text):
+    return re.findall(r'`(\w+)`', text)
+
+
+# Split on commas that are not inside parentheses or quotes
+def _split_top_level(text):
+    parts, depth, quote, current = [], 0, None, []
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+            continue
+        current.append(char)
+    if ''.join(current).strip():
+        parts.append(''.join(current).strip())
+    return parts
+
+
+# Statements of database.sql, comments removed, in file order
+def mysql_statements(path=SCHEMA_PATH):
+    with open(path) as f:
+        text = re.sub(r'^--.*$', '', f.read(), flags=re.M)
+    for statement in re.split(r';\s*$', text, flags=re.M):
+        if statement.strip():
+            yield statement.strip()
+
+
+def parse_schema(path=SCHEMA_PATH):
+    tables = {}
+    inserts = []
+    for statement in mysql_statements(path):
+        head = statement.split(None, 2)[:2]
+        keyword = ' '.join(head).upper()
+        if keyword == 'CREATE TABLE':
+            name = _identifiers(statement)[0]
+            table = tables[name] = Table(name)
+            body = statement[statement.index('(') + 1:statement.rindex(')')]
+            for definition in _split_top_level(body):
+                match = _COLUMN.match(definition)
+                if match:
+                    table.columns.append(match.groups())
+        elif keyword == 'ALTER TABLE':
+            name = _identifiers(statement.split('\n', 1)[0])[0]
+            table = tables[name]
+            for clause in _split_top_level(statement.split('\n', 1)[1]):
+                key = _KEY.match(clause)
+                foreign_key = _FOREIGN_KEY.match(clause)
+                modify = _MODIFY.match(clause)
+                if key:
+                    kind, index, columns = key.group(1).upper().split()[0], key.group(2), _identifiers(key.group(3))
+                    if kind == 'PRIMARY':
+                        table.primary_key = columns
+                    elif kind == 'FULLTEXT':
+                        table.fulltext.append((index, columns))
+                    else:
+                        table.indexes.append((index, columns, kind == 'UNIQUE'))
+                elif foreign_key:
+                    table.foreign_keys.append((_identifiers(foreign_key.group(1)), foreign_key.group(2),
+                                               _identifiers(foreign_key.group(3)), foreign_key.group(4).strip()))
+                elif modify:
+                    table.autoincrement = modify.group(1)
+        elif keyword.startswith('INSERT'):
+            inserts.append(statement)
+    return tables, inserts
+
+
+def _sqlite_column(table, name, column_type, rest):
+    rest = re.sub(r'\bcurrent_timestamp\(\)', 'CURRENT_TIMESTAMP', rest, flags=re.I)
+    rest = re.sub(r'\b(COLLATE|CHARACTER SET)\s+\w+', '', rest, flags=re.I)
+    rest = re.sub(r'\bON UPDATE CURRENT_TIMESTAMP\b', '', rest, flags=re.I).strip()
+    base = column_type.split('(')[0].lower()
+    if table.autoincrement == name and table.primary_key == [name]:
+        return f'"{name}" INTEGER PRIMARY KEY AUTOINCREMENT'
+    # MySQL compares text with a case-insensitive collation; NOCASE keeps lookups and ordering the same
+    if base == 'enum':
+        values = column_type[column_type.index('(') + 1:-1]
+        return f'"{name}" TEXT COLLATE NOCASE {rest} CHECK ("{name}" IN ({values}))'.replace('  ', ' ')
+    if base in ('varchar', 'char', 'text', 'mediumtext', 'longtext'):
+        return f'"{name}" {column_type} COLLATE NOCASE {rest}'.rstrip()
+    if base in ('int', 'tinyint', 'smallint', 'mediumint', 'bigint'):
+        return f'"{name}" INTEGER {rest}'.rstrip()
+    # Keep the declared type (decimal, date, datetime, timestamp) so sqlite3 converters can see it
+    return f'"{name}" {column_type} {rest}'.rstrip()
+
+
+def sqlite_statements(path=SCHEMA_PATH):
+    tables, inserts = parse_schema(path)
+    statements = []
+    for table in tables.values():
+        definitions = [_sqlite_column(table, *column) for column in table.columns]
+        if table.primary_key and not (table.autoincrement and table.primary_key == [table.autoincrement]):
+            definitions.append(f'PRIMARY KEY ({", ".join(table.primary_key)})')
+        for columns, ref_table, ref_columns, actions in table.foreign_keys:
+            definitions.append(f'FOREIGN KEY ({", ".join(columns)}) REFERENCES {ref_table} ({", ".join(ref_columns)}) {actions}'.rstrip())
+        statements.append(f'CREATE TABLE "{table.name}" (\n  ' + ',\n  '.join(definitions) + '\n)')
+
+        # Index names are per table in MySQL but per database in SQLite
+        for index, columns, unique in table.indexes:
+            statements.append(f'CREATE {"UNIQUE " if unique else ""}INDEX "{table.name}_{index}" '
+                              f'ON "{table.name}" ({", ".join(columns)})')
+
+        # FULLTEXT keys become external-content FTS5 tables kept in step by triggers
+        for index, columns in table.fulltext:
+            fts = table.fulltext_table(index)
+            column_list = ', '.join(columns)
+            new_values = ', '.join(f'new.{column}' for column in columns)
+            old_values = ', '.join(f'old.{column}' for column in columns)
+            statements.append(f'CREATE VIRTUAL TABLE "{fts}" USING fts5({column_list}, '
+                              f'content="{table.name}", content_rowid="{table.primary_key[0]}")')
+            statements.append(f'CREATE TRIGGER "{fts}_insert" AFTER INSERT ON "{table.name}" BEGIN '
+                              f'INSERT INTO "{fts}" (rowid, {column_list}) VALUES (new.rowid, {new_values}); END')
+            statements.append(f'CREATE TRIGGER "{fts}_delete" AFTER DELETE ON "{table.name}" BEGIN '
+                              f'INSERT INTO "{fts}" ("{fts}", rowid, {column_list}) VALUES (\'delete\', old.rowid, {old_values}); END')
+            statements.append(f'CREATE TRIGGER "{fts}_update" AFTER UPDATE OF {column_list} ON "{table.name}" BEGIN '
+                              f'INSERT INTO "{fts}" ("{fts}", rowid, {column_list}) VALUES (\'delete\', old.rowid, {old_values}); '
+                              f'INSERT INTO "{fts}" (rowid, {column_list}) VALUES (new.rowid, {new_values}); END')
+    return statements + inserts
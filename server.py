@@ -0,0 +1,233 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger('pharmacy.server')
+
+# Pre-forking production server: python server.py [--bind 0.0.0.0:8000] [--workers 4] [--threads 8]
+#
+# The master imports the app and compiles every template once, then forks
+# the workers, which share that memory copy-on-write and each serve up to
+# SERVER_THREADS requests at a time from the shared listening socket.
+# Database pools and the like are only created in the workers (see
+# reset_process_state in app.py).
+#
+# Signals to the master:
+#   SIGTERM, SIGINT  stop accepting, let requests in flight finish (up to
+#                    SERVER_GRACEFUL_TIMEOUT seconds), then exit
+#   SIGHUP           reload: the master re-executes itself on the same
+#                    socket, loads the current code and config, starts new
+#                    workers and only then drains the old ones
+LISTEN_FD_ENV = 'PHARMACY_SERVER_FD'
+RETIRE_ENV = 'PHARMACY_SERVER_RETIRE'
+
+
+# One response per connection, so a drained worker is never held open by an idle keep-alive client
+class RequestHandler(WSGIRequestHandler):
+    protocol_version = 'HTTP/1.0'
+
+
+# Werkzeug server that hands each accepted connection to a fixed pool of
+# threads instead of starting a thread per connection
+class ThreadPoolWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd):
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        # Every worker polls the shared socket; the ones that lose the race get EAGAIN instead of blocking
+        self.socket.setblocking(False)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+    def process_request(self, request, client_address):
+        request.setblocking(True)
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def parse_bind(bind):
+    host, _, port = bind.rpartition(':')
+    return host.strip('[]') or '0.0.0.0', int(port)
+
+
+def create_listener(bind, backlog):
+    if LISTEN_FD_ENV in os.environ:
+        # Inherited from the master this one replaced on SIGHUP
+        return socket.socket(fileno=int(os.environ.pop(LISTEN_FD_ENV)))
+    host, port = parse_bind(bind)
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    return socket.create_server((host, port), family=family, backlog=backlog)
+
+
+def run_worker(app, listener, threads):
+    host, port = listener.getsockname()[:2]
+    server = ThreadPoolWSGIServer(host, port, app, threads, listener.fileno())
+
+    def drain(signum, frame):
+        app.config['SERVER_DRAINING'] = True
+        # shutdown() waits for serve_forever to return, so it cannot run in the loop's own thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    logger.info('Worker %d serving with %d threads', os.getpid(), threads)
+    server.serve_forever()
+    # Stopped accepting; finish what was already accepted
+    server.executor.shutdown(wait=True)
+    logger.info('Worker %d drained', os.getpid())
+
+
+class Master:
+    def __init__(self, app, listener, workers, threads, graceful_timeout):
+        self.app = app
+        self.listener = listener
+        self.worker_count = workers
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.workers = set()
+        self.retiring = {}  # pid -> time after which it is killed
+        self.signals = []
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers.add(pid)
+            return
+        status = 0
+        try:
+            run_worker(self.app, self.listener, self.threads)
+        except Exception:
+            logger.exception('Worker %d failed', os.getpid())
+            status = 1
+        finally:
+            logging.shutdown()
+            os._exit(status)
+
+    def retire(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.workers.discard(pid)
+            self.retiring[pid] = deadline
+            self._kill(pid, signal.SIGTERM)
+
+    @staticmethod
+    def _kill(pid, sig):
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if pid in self.workers:
+                logger.warning('Worker %d exited unexpectedly (status %d)', pid, status)
+            self.workers.discard(pid)
+            self.retiring.pop(pid, None)
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now > deadline:
+                logger.warning('Worker %d did not drain in %ds, killing it', pid, self.graceful_timeout)
+                self._kill(pid, signal.SIGKILL)
+                self.retiring[pid] = float('inf')
+
+    # Replace this process with a fresh interpreter on the same socket. The
+    # workers stay our children (exec keeps the pid) and keep serving until
+    # the new master has its own workers up and retires them.
+    def reexec(self):
+        logger.info('Reloading')
+        self.listener.set_inheritable(True)
+        os.environ[LISTEN_FD_ENV] = str(self.listener.fileno())
+        os.environ[RETIRE_ENV] = ','.join(str(pid) for pid in self.workers | set(self.retiring))
+        logging.shutdown()
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+    def run(self, inherited=()):
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, lambda signum, frame: self.signals.append(signum))
+
+        # Whatever the preload allocated is never freed, so keep the collector
+        # from touching (and un-sharing) those pages in the workers
+        gc.freeze()
+        for _ in range(self.worker_count):
+            self.spawn()
+        self.retire(inherited)
+        logger.info('Master %d listening on %s with %d workers', os.getpid(), self.listener.getsockname()[:2],
+                    self.worker_count)
+
+        while True:
+            if self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reexec()
+                logger.info('Shutting down')
+                break
+            self.reap()
+            self.kill_overdue()
+            while len(self.workers) < self.worker_count:
+                self.spawn()
+            time.sleep(0.2)
+
+        self.retire(set(self.workers))
+        while self.retiring:
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.1)
+        self.listener.close()
+
+
+# Import the app, compile every template and build the static assets while still
+# single-process, and check the config
+def preload():
+    from app import app, get_asset_manifest
+
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    if app.config['ASSETS_FINGERPRINT']:
+        get_asset_manifest()
+    if app.secret_key == 'your_secret_key':
+        raise SystemExit('Set PHARMACY_SECRET_KEY before running in production.')
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the app on a pre-forking multi-process server')
+    parser.add_argument('--bind', help='host:port to listen on (SERVER_BIND)')
+    parser.add_argument('--workers', type=int, help='worker processes (SERVER_WORKERS)')
+    parser.add_argument('--threads', type=int, help='request threads per worker (SERVER_THREADS)')
+    parser.add_argument('--graceful-timeout', type=int, help='seconds a worker gets to drain (SERVER_GRACEFUL_TIMEOUT)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(process)d] %(levelname)s %(name)s: %(message)s')
+    app = preload()
+    inherited = [int(pid) for pid in os.environ.pop(RETIRE_ENV, '').split(',') if pid]
+    listener = create_listener(args.bind or app.config['SERVER_BIND'], app.config['SERVER_BACKLOG'])
+    Master(app, listener, args.workers or app.config['SERVER_WORKERS'], args.threads or app.config['SERVER_THREADS'],
+           args.graceful_timeout or app.config['SERVER_GRACEFUL_TIMEOUT']).run(inherited)
+
+
+if __name__ == '__main__':
+    main()
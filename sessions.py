@@ -0,0 +1,294 @@
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+serializer = TaggedJSONSerializer()
+
+
+# Session stores keep {sid: (data, user_id, expires_at)} and an index from
+# user_id to sids so every session of a user can be revoked at once.
+
+class MemorySessionStore:
+    def __init__(self, max_sessions=10000):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # sid -> (payload, user_id, expires_at)
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    def load(self, sid):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is None:
+                return None
+            if entry[2] < time.time():
+                self._remove(sid)
+                return None
+            self._sessions.move_to_end(sid)
+            return serializer.loads(entry[0]), entry[2]
+
+    def save(self, sid, data, user_id, ttl):
+        with self._lock:
+            self._remove(sid)
+            self._sessions[sid] = (serializer.dumps(data), user_id, time.time() + ttl)
+            if user_id is not None:
+                self._by_user.setdefault(user_id, set()).add(sid)
+            while len(self._sessions) > self.max_sessions:
+                self._remove(next(iter(self._sessions)))
+
+    def touch(self, sid, ttl):
+        with self._lock:
+            entry = self._sessions.get(sid)
+            if entry is not None:
+                self._sessions[sid] = (entry[0], entry[1], time.time() + ttl)
+
+    def delete(self, sid):
+        with self._lock:
+            self._remove(sid)
+
+    def revoke_user(self, user_id):
+        with self._lock:
+            for sid in list(self._by_user.get(user_id, ())):
+                self._remove(sid)
+
+    def _remove(self, sid):
+        entry = self._sessions.pop(sid, None)
+        if entry is not None and entry[1] is not None:
+            sids = self._by_user.get(entry[1])
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self._by_user[entry[1]]
+
+
+class SQLiteSessionStore:
+    # Expired rows are swept once every this many saves
+    SWEEP_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._saves = 0
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                sid TEXT PRIMARY KEY,
+                user_id INTEGER,
+                data TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_user_id ON sessions (user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+        conn.commit()
+
+    def _connection(self):
+        # One connection per thread; WAL lets readers carry on while another thread writes
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        row = self._connection().execute(
+            "SELECT data, expires_at FROM sessions WHERE sid = ? AND expires_at >= ?", (sid, time.time())).fetchone()
+        if row is None:
+            return None
+        return serializer.loads(row[0]), row[1]
+
+    def save(self, sid, data, user_id, ttl):
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO sessions (sid, user_id, data, expires_at) VALUES (?, ?, ?, ?)",
+                     (sid, user_id, serializer.dumps(data), time.time() + ttl))
+        self._saves += 1
+        if self._saves % self.SWEEP_EVERY == 0:
+            conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+        conn.commit()
+
+    def touch(self, sid, ttl):
+        conn = self._connection()
+        conn.execute("UPDATE sessions SET expires_at = ? WHERE sid = ?", (time.time() + ttl, sid))
+        conn.commit()
+
+    def delete(self, sid):
+        conn = self._connection()
+        conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+        conn.commit()
+
+    def revoke_user(self, user_id):
+        conn = self._connection()
+        conn.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+        conn.commit()
+
+
+class RedisSessionStore:
+    def __init__(self, url, prefix='pharmacy:session:'):
+        if redis is None:
+            raise RuntimeError('The redis package is required for the redis session backend')
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def load(self, sid):
+        pipe = self._client.pipeline()
+        pipe.get(self.prefix + sid)
+        pipe.ttl(self.prefix + sid)
+        payload, ttl = pipe.execute()
+        if payload is None:
+            return None
+        return serializer.loads(payload.decode()), time.time() + max(ttl, 0)
+
+    def save(self, sid, data, user_id, ttl):
+        pipe = self._client.pipeline()
+        pipe.set(self.prefix + sid, serializer.dumps(data), ex=int(ttl))
+        if user_id is not None:
+            # The per-user set only needs to outlive the newest session in it
+            pipe.sadd(f'{self.prefix}user:{user_id}', sid)
+            pipe.expire(f'{self.prefix}user:{user_id}', int(ttl))
+        pipe.execute()
+
+    def touch(self, sid, ttl):
+        self._client.expire(self.prefix + sid, int(ttl))
+
+    def delete(self, sid):
+        self._client.delete(self.prefix + sid)
+
+    def revoke_user(self, user_id):
+        key = f'{self.prefix}user:{user_id}'
+        sids = self._client.smembers(key)
+        if sids:
+            self._client.delete(*[self.prefix + sid.decode() for sid in sids])
+        self._client.delete(key)
+
+
+# Session whose data is only fetched from the store on first access, so
+# requests that never look at the session never touch the store.
+class ServerSession(SessionMixin):
+    def __init__(self, store, sid=None):
+        self.store = store
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self.expires_at = None
+        self._data = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = {}
+            if self.sid is not None:
+                loaded = self.store.load(self.sid)
+                if loaded is None:
+                    # Expired or revoked: carry on with a fresh session under a new id
+                    self.sid = None
+                    self.new = True
+                else:
+                    self._data, self.expires_at = loaded
+        self.accessed = True
+        return self._data
+
+    @property
+    def loaded(self):
+        return self._data is not None
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self.modified = True
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        self.data.clear()
+        self.modified = True
+
+    # Issue a new id for the same data, e.g. at login, so an id handed out before authentication is useless
+    def regenerate(self):
+        self.data
+        if self.sid is not None:
+            self.store.delete(self.sid)
+        self.sid = None
+        self.modified = True
+
+
+# get_store is called at request time rather than at import, so each worker
+# process opens its own store connection after forking
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, get_store):
+        self.get_store = get_store
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt='server-session')
+
+    def open_session(self, app, request):
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        sid = None
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+        return ServerSession(self.get_store(), sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        ttl = app.config['SESSION_IDLE_TIMEOUT'].total_seconds()
+        store = session.store
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.loaded:
+            # Nothing read or written this request; the store was never touched
+            return
+
+        if not session:
+            if session.modified and session.sid is not None:
+                store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if session.modified or session.sid is None:
+            if session.sid is None:
+                session.sid = secrets.token_urlsafe(32)
+            store.save(session.sid, dict(session), session.get('user_id'), ttl)
+        elif session.expires_at is not None and session.expires_at - time.time() < ttl * 0.9:
+            # Slide the idle timeout, but at most once per tenth of it to keep reads write-free
+            store.touch(session.sid, ttl)
+        else:
+            return
+
+        response.set_cookie(
+            name,
+            self._signer(app).sign(session.sid.encode()).decode(),
+            max_age=int(ttl),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            httponly=self.get_cookie_httponly(app),
+            samesite=self.get_cookie_samesite(app),
+        )
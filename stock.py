@@ -0,0 +1,53 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Gives the stock of expired cart holds back and folds the shards of split
+# products into their products rows (see StockRepository), every interval
+# seconds. on_change(product_ids) hears which products rows it changed, so
+# their cached copies can be dropped.
+class StockSweeper:
+    def __init__(self, db, on_change=None, batch_size=500, interval=5.0):
+        self.db = db
+        self.on_change = on_change
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self.sweeps = 0
+        self.units_returned = 0
+        self.folded = 0
+
+    def _count(self, field, amount):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    # Expire every hold that is due, then fold; returns the products changed
+    def run_once(self):
+        changed = set()
+        while True:
+            returned = self.db.stock.expire(self.batch_size)
+            if not returned:
+                break
+            changed.update(returned)
+            self._count('units_returned', sum(returned.values()))
+        folded = self.db.stock.fold()
+        self._count('folded', len(folded))
+        changed.update(folded)
+        if changed and self.on_change:
+            self.on_change(sorted(changed))
+        self._count('sweeps', 1)
+        return changed
+
+    def run(self, stop):
+        while not stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception('Stock sweep failed')
+            stop.wait(self.interval)
+
+    def stats(self):
+        with self._lock:
+            return {'sweeps': self.sweeps, 'units_returned': self.units_returned, 'folded': self.folded}
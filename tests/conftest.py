@@ -0,0 +1,36 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as pharmacy
+
+ACCOUNTS = {
+    'Admin': ('Admin', 'testingAdminPass1234'),
+    'Pharmacist': ('Pharmacist', 'testingpharmacistPass1234'),
+    'Customer': ('Customer', 'testinCustomerPass1234'),
+}
+
+
+# The app on a fresh SQLite file per test, with the background threads off;
+# settings a test changes are put back afterwards
+@pytest.fixture
+def app_module(tmp_path):
+    saved = dict(pharmacy.app.config)
+    pharmacy.app.config.update(DB_BACKEND='sqlite', SQLITE_PATH=str(tmp_path / 'pharmacy.sqlite3'),
+                               SESSION_BACKEND='memory', TESTING=True, PASSWORD_SCRYPT_N=2 ** 10,
+                               OUTBOX_EMBEDDED_WORKER=False, STOCK_EMBEDDED_SWEEPER=False)
+    pharmacy.reset_process_state()
+    yield pharmacy
+    pharmacy.reset_process_state()
+    pharmacy.app.config.clear()
+    pharmacy.app.config.update(saved)
+
+
+def login(client, role):
+    username, password = ACCOUNTS[role]
+    response = client.post('/login', data={'username': username, 'password': password})
+    assert response.status_code == 302
+    return client
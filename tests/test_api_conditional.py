@@ -0,0 +1,32 @@
+import pytest
+
+
+@pytest.fixture
+def client(app_module):
+    app_module.app.config['API_COMPRESSION_MIN_SIZE'] = 0
+    client = app_module.app.test_client()
+    response = client.post('/api/v1/login', json={'username': 'Customer', 'password': 'testinCustomerPass1234'})
+    assert response.status_code == 200
+    client.put('/api/v1/cart/1', json={'quantity': 2})
+    return client
+
+
+# A gzip client sends back the "-gz" tag it was given and must still get a 304
+@pytest.mark.parametrize('path', ['/api/v1/cart', '/api/v1/orders'])
+@pytest.mark.parametrize('encoding', ['gzip', 'identity'])
+def test_body_etag_revalidates(client, path, encoding):
+    first = client.get(path, headers={'Accept-Encoding': encoding})
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert etag.endswith('-gz"') == (encoding == 'gzip')
+
+    again = client.get(path, headers={'Accept-Encoding': encoding, 'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+
+def test_changed_body_is_sent_again(client):
+    etag = client.get('/api/v1/cart', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    client.put('/api/v1/cart/2', json={'quantity': 1})
+    response = client.get('/api/v1/cart', headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert response.status_code == 200
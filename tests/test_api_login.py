@@ -0,0 +1,32 @@
+import pytest
+
+
+@pytest.mark.parametrize('body', [
+    [],
+    'Customer',
+    42,
+    None,
+    {'username': 'Customer', 'password': 12345},
+    {'username': 'Customer', 'password': None},
+    {'username': ['Customer'], 'password': 'testinCustomerPass1234'},
+])
+def test_malformed_login_is_rejected(app_module, body):
+    response = app_module.app.test_client().post('/api/v1/login', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_login_with_strings(app_module):
+    client = app_module.app.test_client()
+    response = client.post('/api/v1/login', json={'username': 'Customer', 'password': 'wrong'})
+    assert response.status_code == 401
+    response = client.post('/api/v1/login', json={'username': 'Customer', 'password': 'testinCustomerPass1234'})
+    assert response.status_code == 200
+    assert response.get_json()['role'] == 'Customer'
+
+
+def test_verify_password_rejects_non_strings():
+    from passwords import hash_password, verify_password
+    legacy = '0' * 64
+    assert not verify_password(12345, legacy)
+    assert not verify_password(None, hash_password('secret', n=2 ** 10))
@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backends import DatabaseError
+
+THREADS = 16
+CHECKOUTS = 120
+STOCK = 50
+QUANTITY = 2
+
+
+def create_product(pharmacy, stock_quantity):
+    conn = pharmacy.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("INSERT INTO products (name, description, price, stock_quantity, category) VALUES (%s, %s, %s, %s, %s)",
+                   ('Concurrency Test Item', 'Created by test_checkout_concurrency.py', 1.00, stock_quantity, 'Test'))
+    product_id = cursor.lastrowid
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return product_id
+
+
+# More checkouts than the stock covers, all at once: every unit is sold at
+# most once, and the orders account for exactly the stock that went
+@pytest.mark.parametrize('shards', [0, 4])
+def test_parallel_checkouts_never_oversell(app_module, shards):
+    app_module.app.config.update(DB_POOL_SIZE=THREADS, DB_POOL_MAX_OVERFLOW=0)
+    product_id = create_product(app_module, STOCK)
+    if shards:
+        app_module.db.stock.split(product_id, shards)
+
+    def checkout(_):
+        try:
+            app_module.db.orders.place(3, {product_id: QUANTITY})
+            return 'placed'
+        except app_module.InsufficientStock:
+            return 'rejected'
+        except DatabaseError as err:
+            return repr(err)
+
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        outcomes = list(executor.map(checkout, range(CHECKOUTS)))
+    placed = outcomes.count('placed')
+    errors = [outcome for outcome in outcomes if outcome not in ('placed', 'rejected')]
+
+    app_module.db.stock.fold()
+    conn = app_module.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT stock_quantity, units_sold FROM products WHERE id = %s", (product_id,))
+    stock_quantity, units_sold = cursor.fetchone()
+    cursor.execute("SELECT COALESCE(SUM(quantity), 0) FROM OrderItems WHERE product_id = %s", (product_id,))
+    ordered = int(cursor.fetchone()[0])
+    cursor.close()
+    conn.close()
+
+    assert errors == []
+    assert placed == STOCK // QUANTITY
+    assert stock_quantity == STOCK - placed * QUANTITY >= 0
+    assert ordered == units_sold == placed * QUANTITY
+    assert app_module.get_db_pool().stats()['in_use'] == 0
+
+
+# SQLite runs whole checkouts one at a time, so the test above cannot
+# interleave them the way MySQL does. Here the unlocked stock read is stale,
+# as when another checkout commits in between: the guarded UPDATE refuses it.
+def test_checkout_on_a_stale_stock_read_is_refused(app_module, monkeypatch):
+    product_id = create_product(app_module, QUANTITY)
+    app_module.db.orders.place(3, {product_id: QUANTITY})
+
+    products = app_module.db.stock.products
+
+    def stale_products(cursor, product_ids):
+        rows = products(cursor, product_ids)
+        rows[product_id]['stock_quantity'] = QUANTITY
+        return rows
+
+    monkeypatch.setattr(app_module.db.stock, 'products', stale_products)
+    with pytest.raises(app_module.InsufficientStock):
+        app_module.db.orders.place(3, {product_id: QUANTITY})
+
+    conn = app_module.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT stock_quantity FROM products WHERE id = %s", (product_id,))
+    assert cursor.fetchone()[0] == 0
+    cursor.execute("SELECT COUNT(*) FROM OrderItems WHERE product_id = %s", (product_id,))
+    assert cursor.fetchone()[0] == 1
+    cursor.close()
+    conn.close()
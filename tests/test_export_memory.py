@@ -0,0 +1,66 @@
+# Peak RSS of a process that streams /export/orders.csv to the end stays
+# flat as the number of order items grows. Each export runs in a fresh
+# process (this file run as a script), so ru_maxrss covers only the app,
+# the login and the export; the seeding happens here.
+import os
+import resource
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+SIZES = (10000, 300000)
+RSS_GROWTH_LIMIT_MB = 10  # a buffered body of 300k rows adds about 25 MB
+SEED_BATCH_SIZE = 10000
+
+
+def seed(pharmacy, start, count):
+    conn = pharmacy.get_db_connection()
+    cursor = conn.cursor()
+    for first in range(start, start + count, SEED_BATCH_SIZE):
+        batch = min(SEED_BATCH_SIZE, start + count - first)
+        cursor.executemany("INSERT INTO Orders (customer_id, order_date, status, total_amount) VALUES (%s, %s, %s, %s)",
+                           [(3, datetime(2024, 1, 1) + timedelta(minutes=first + i), 'Delivered', 9.99)
+                            for i in range(batch)])
+        cursor.execute("SELECT id FROM Orders ORDER BY id DESC LIMIT %s", (batch,))
+        cursor.executemany("INSERT INTO OrderItems (order_id, product_id, quantity, price) VALUES (%s, %s, %s, %s)",
+                           [(row[0], 1, 1, 9.99) for row in cursor.fetchall()])
+        conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def export_peak_mb(sqlite_path):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), sqlite_path],
+                            check=True, capture_output=True, text=True).stdout.split()
+    rows, peak_kb = int(output[-2]), int(output[-1])
+    if sys.platform == 'darwin':
+        peak_kb //= 1024
+    return rows, peak_kb / 1024
+
+
+def test_export_peak_rss_is_flat(app_module):
+    sqlite_path = app_module.app.config['SQLITE_PATH']
+    peaks, seeded = [], 0
+    for size in SIZES:
+        seed(app_module, seeded, size - seeded)
+        seeded = size
+        rows, peak_mb = export_peak_mb(sqlite_path)
+        assert rows >= size
+        peaks.append(peak_mb)
+    assert max(peaks) - peaks[0] < RSS_GROWTH_LIMIT_MB, peaks
+
+
+# Child: log in as the admin, read the export to the end, print rows and peak RSS
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+    import app as pharmacy
+    from conftest import login
+
+    pharmacy.app.config.update(DB_BACKEND='sqlite', SQLITE_PATH=sys.argv[1], SESSION_BACKEND='memory', TESTING=True,
+                               OUTBOX_EMBEDDED_WORKER=False, STOCK_EMBEDDED_SWEEPER=False)
+    client = login(pharmacy.app.test_client(), 'Admin')
+    response = client.get('/export/orders.csv', buffered=False)
+    assert response.status_code == 200
+    lines = sum(chunk.count(b'\n') for chunk in response.iter_encoded())
+    response.close()
+    print(lines - 1, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
@@ -0,0 +1,70 @@
+import sqlite3
+
+from conftest import login
+
+ITEMS = 5000  # several EXPORT_CHUNK_SIZE chunks
+
+
+def seed_order_items(pharmacy, count):
+    conn = pharmacy.get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO Orders (customer_id, status, total_amount) VALUES (%s, %s, %s)",
+                       [(3, 'Delivered', 9.99)] * count)
+    cursor.execute("SELECT id FROM Orders ORDER BY id DESC LIMIT %s", (count,))
+    cursor.executemany("INSERT INTO OrderItems (order_id, product_id, quantity, price) VALUES (%s, %s, %s, %s)",
+                       [(row[0], 1, 1, 9.99) for row in cursor.fetchall()])
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def test_export_streams_every_row(app_module):
+    seed_order_items(app_module, ITEMS)
+    client = login(app_module.app.test_client(), 'Admin')
+    response = client.get('/export/orders.csv', buffered=False)
+    body = b''.join(response.iter_encoded())
+    response.close()
+    assert body.count(b'\n') >= ITEMS + 1
+    assert app_module.get_db_pool().stats()['in_use'] == 0
+
+
+# A client that goes away partway closes the body early; the connection
+# still goes back to the pool
+def test_abandoned_export_releases_connection(app_module):
+    seed_order_items(app_module, ITEMS)
+    client = login(app_module.app.test_client(), 'Admin')
+    response = client.get('/export/orders.csv', buffered=False)
+    chunks = response.iter_encoded()
+    next(chunks)
+    next(chunks)
+    assert app_module.get_db_pool().stats()['in_use'] == 1
+    response.close()
+    assert app_module.get_db_pool().stats()['in_use'] == 0
+
+
+# mysql-connector refuses to close an unbuffered cursor with rows left
+# unread; the connection is then dropped instead of pooled again
+class UnreadResultCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def close(self):
+        self._cursor.close()
+        raise sqlite3.InterfaceError('Unread result found')
+
+
+def test_abandoned_export_drops_connection_that_cannot_close(app_module, monkeypatch):
+    seed_order_items(app_module, ITEMS)
+    export_stream = app_module.db.orders.export_stream
+    monkeypatch.setattr(app_module.db.orders, 'export_stream', lambda filters: UnreadResultCursor(export_stream(filters)))
+    client = login(app_module.app.test_client(), 'Admin')
+    response = client.get('/export/orders.csv', buffered=False)
+    next(response.iter_encoded())
+    invalidated = app_module.get_db_pool().stats()['invalidated']
+    response.close()
+    stats = app_module.get_db_pool().stats()
+    assert stats['in_use'] == 0
+    assert stats['invalidated'] == invalidated + 1
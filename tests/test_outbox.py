@@ -0,0 +1,37 @@
+from outbox import OutboxWorker, order_event_handlers
+
+
+def create_product(pharmacy, stock_quantity, reorder_level):
+    conn = pharmacy.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO products (name, description, price, stock_quantity, category, reorder_level)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, ('Outbox Test Item', 'Created by test_outbox.py', 4.5, stock_quantity, 'Test', reorder_level))
+    product_id = cursor.lastrowid
+    conn.commit()
+    cursor.close()
+    conn.close()
+    return product_id
+
+
+# Both orders are handled in one batch, after the second has already taken
+# the stock further down; the first is still the one that crossed the level
+def test_stock_alert_for_the_order_that_crossed_the_level(app_module):
+    product_id = create_product(app_module, 12, 10)
+    first = app_module.db.orders.place(3, {product_id: 3})
+    app_module.db.orders.place(3, {product_id: 5})
+
+    alerts = []
+    worker = OutboxWorker(app_module.db, order_event_handlers(10, send_receipt=lambda *args: None,
+                                                              send_alert=alerts.append), threads=1)
+    assert worker.run_once() == 2
+    assert worker.stats()['processed'] == 2
+    assert alerts == [f"Low stock: #{product_id} Outbox Test Item has 9 left (reorder level 10)"]
+
+    conn = app_module.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT payload FROM order_events WHERE order_id = %s", (first,))
+    assert '"stock": {"%d": [12, 9]}' % product_id in cursor.fetchone()[0]
+    cursor.close()
+    conn.close()
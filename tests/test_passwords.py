@@ -0,0 +1,75 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import passwords
+from passwords import PasswordHasher, PasswordHasherBusy
+
+HASH_SECONDS = 0.2
+
+
+@pytest.fixture
+def slow_hashing(monkeypatch):
+    verify_password = passwords.verify_password
+
+    def slow_verify(password, stored):
+        time.sleep(HASH_SECONDS)
+        return verify_password(password, stored)
+    monkeypatch.setattr(passwords, 'verify_password', slow_verify)
+
+
+def test_full_queue_refuses_at_once(slow_hashing):
+    hasher = PasswordHasher(n=2 ** 10, workers=1, max_queue=1)
+    stored = passwords.hash_password('secret', n=2 ** 10)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        running = [pool.submit(hasher.verify, 'secret', stored) for _ in range(2)]
+        time.sleep(HASH_SECONDS / 4)
+        started = time.perf_counter()
+        with pytest.raises(PasswordHasherBusy):
+            hasher.verify('secret', stored)
+        assert time.perf_counter() - started < HASH_SECONDS / 2
+        assert all(future.result() for future in running)
+    assert hasher.stats() == {'pending': 0, 'max_pending': 2, 'rejected': 1}
+
+
+# Eight server threads and a burst of twenty logins: the logins past the
+# queue get a quick 503, so a page requested behind them is served at once
+# instead of after the whole burst has been hashed one at a time
+def test_login_burst_does_not_stall_other_routes(app_module, slow_hashing):
+    app_module.app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=2)
+    client = app_module.app.test_client()
+    client.get('/about_us')
+
+    def login():
+        return app_module.app.test_client().post('/login', data={'username': 'Customer',
+                                                                 'password': 'testinCustomerPass1234'})
+
+    def about():
+        started = time.perf_counter()
+        response = client.get('/about_us')
+        return response.status_code, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=8) as server:
+        logins = [server.submit(login) for _ in range(20)]
+        requested = time.perf_counter()
+        page = server.submit(about)
+        status, _ = page.result()
+        waited = time.perf_counter() - requested
+        responses = [future.result() for future in logins]
+
+    assert status == 200
+    assert waited < 2 * HASH_SECONDS
+    assert any(response.status_code == 302 for response in responses)
+    refused = [response for response in responses if response.status_code == 503]
+    assert refused and all(response.headers['Retry-After'] == '2' for response in refused)
+
+
+def test_api_login_refused_with_json(app_module, monkeypatch):
+    def busy(*args):
+        raise PasswordHasherBusy()
+    monkeypatch.setattr(app_module.get_password_hasher(), 'verify', busy)
+    response = app_module.app.test_client().post('/api/v1/login', json={'username': 'Customer', 'password': 'x'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '2'
+    assert 'error' in response.get_json()
@@ -0,0 +1,96 @@
+import time
+
+import pytest
+from flask import g
+
+from conftest import login
+
+
+# The primary and a replica as two SQLite files; the replica builds its own
+# copy of the schema and seed data. The databases each request used are
+# collected from its RequestStats.
+@pytest.fixture
+def replica_app(app_module, tmp_path, monkeypatch):
+    app_module.app.config['DB_REPLICAS'] = [f'sqlite:///{tmp_path / "replica.sqlite3"}']
+    targets = []
+    report_request_stats = app_module.report_request_stats
+
+    def record_targets(stats, endpoint, *args):
+        targets.append((endpoint, dict(stats.target_queries)))
+        return report_request_stats(stats, endpoint, *args)
+
+    monkeypatch.setattr(app_module, 'report_request_stats', record_targets)
+    app_module.targets = targets
+    return app_module
+
+
+def targets_of(pharmacy, endpoint):
+    return [queries for name, queries in pharmacy.targets if name == endpoint][-1]
+
+
+# Logging in writes, which pins the session to the primary; tests that want
+# the replica clear the pin first
+def unpin(client):
+    with client.session_transaction() as session:
+        session.pop('primary_until', None)
+
+
+def test_replica_route_reads_from_the_replica(replica_app):
+    client = login(replica_app.app.test_client(), 'Admin')
+    unpin(client)
+    assert client.get('/manage_orders').status_code == 200
+    queries = targets_of(replica_app, 'manage_orders')
+    assert queries.get('replica-0', 0) > 0
+    assert 'primary' not in queries
+
+
+def test_writes_and_transactions_stay_on_the_primary(replica_app):
+    client = login(replica_app.app.test_client(), 'Customer')
+    unpin(client)
+    response = client.post('/add_to_cart/1', data={'quantity': 1})
+    assert response.status_code == 302
+    assert 'replica-0' not in targets_of(replica_app, 'add_to_cart')
+
+    # A transaction inside a @read_replica route still reads on the primary
+    with replica_app.app.test_request_context('/manage_orders'):
+        g.use_replica = True
+        with replica_app.db.transaction() as cursor:
+            cursor.execute("SELECT stock_quantity FROM products WHERE id = %s", (1,))
+        queries = dict(replica_app.get_request_stats().target_queries)
+        assert 'replica-0' not in queries
+        with replica_app.db.cursor() as cursor:
+            cursor.execute("SELECT stock_quantity FROM products WHERE id = %s", (1,))
+        assert replica_app.get_request_stats().target_queries['replica-0'] == 1
+
+
+def test_write_pins_the_session_to_the_primary(replica_app):
+    order_id = replica_app.db.orders.place(3, {1: 1})
+    client = login(replica_app.app.test_client(), 'Admin')
+    unpin(client)
+    response = client.post(f'/update_order_status/{order_id}', data={'status': 'Processing'})
+    assert response.status_code == 302
+    with client.session_transaction() as session:
+        assert session['primary_until'] > time.time()
+
+    client.get('/manage_orders')
+    queries = targets_of(replica_app, 'manage_orders')
+    assert queries.get('primary', 0) > 0
+    assert 'replica-0' not in queries
+
+    # Once the replica has had DB_REPLICA_MAX_LAG to catch up, reads go back to it
+    with client.session_transaction() as session:
+        session['primary_until'] = time.time() - 1
+    client.get('/manage_orders')
+    assert 'primary' not in targets_of(replica_app, 'manage_orders')
+
+
+def test_unreachable_replica_falls_back_to_the_primary(replica_app, tmp_path):
+    # A directory cannot be opened as a database file
+    (tmp_path / 'replica').mkdir()
+    replica_app.app.config['DB_REPLICAS'] = [f'sqlite:///{tmp_path / "replica"}']
+    client = login(replica_app.app.test_client(), 'Admin')
+    unpin(client)
+    assert client.get('/manage_orders').status_code == 200
+    queries = targets_of(replica_app, 'manage_orders')
+    assert queries.get('primary', 0) > 0
+    assert 'replica-0' not in queries